@@ -1,59 +1,74 @@
-from langchain_text_splitters import TokenTextSplitter
+import argparse
 
 from internal.llm.bart import BartLLM
-from internal.langchain.wikipedia_api import WikipediaDocumentLoader
+from internal.llm.canonicalizer import EntityCanonicalizer
+from internal.llm.cooccurrence import CooccurrenceBuilder
+from internal.llm.entity_extractor import entity_extractor
+from internal.langchain.bulk_wikipedia_loader import BulkWikipediaLoader, add_page_arguments, loader_from_arguments
+from internal.langchain.token_chunker import TokenChunker
 from db.neo4j.neo4j_connector import Neo4jEngine
+from internal.metrics.metrics import metrics
 
 
-def load_wikipedia_page(page_title: str):
-    loader = WikipediaDocumentLoader(page_title)
+def load_wikipedia_pages(loader: BulkWikipediaLoader):
     raw_documents = loader.load()
-    splitter = TokenTextSplitter(chunk_size=512, chunk_overlap=24)
-    documents = splitter.split_documents(raw_documents)
-    return [doc.page_content for doc in documents]
+    chunker = TokenChunker(chunk_size=512, chunk_overlap=24)
+    return [chunk.text for doc in raw_documents for chunk in chunker.iter_text_chunks(doc.page_content)]
 
 
-def main():
-    page_title = "Marcus Aurelius"
+def main(wikipedia_loader: BulkWikipediaLoader):
+    BartLLM.preload()
     neo4j_uri = "bolt://localhost:7687"
     neo4j_user = "neo4j"
     neo4j_password = "your_password"
     neo4j_engine = Neo4jEngine(neo4j_uri, neo4j_user, neo4j_password)
 
-    # Step 1: Load and chunk Wikipedia page
-    chunks = load_wikipedia_page(page_title)
+    # Step 1: Load and chunk Wikipedia pages
+    with metrics.timer("stage_seconds", stage="fetch_and_split"):
+        chunks = load_wikipedia_pages(wikipedia_loader)
     llm = BartLLM(chunks)
 
     # Step 2: Use BART to generate summaries for each chunk
-    summaries = llm.generate_summary()
+    with metrics.timer("stage_seconds", stage="summarize"):
+        summaries = llm.generate_summary_batched()
 
     # Step 3: Extract entities and relationships from each summary
     all_entities = []
-    all_relationships = []
+    relationship_builder = CooccurrenceBuilder(window=1, unit="sentence")
 
-    # Log entities and relationships
-    for idx, summary in enumerate(summaries):
-        print(f"\nSummary {idx + 1}: {summary}\n")
+    with metrics.timer("stage_seconds", stage="extract"):
+        for summary in summaries:
+            # Multi-word names are merged and common non-entity words (e.g., 'For', 'The', 'and') dropped
+            filtered_entities = entity_extractor.extract(summary)
+            metrics.inc("entities_extracted_total", len(filtered_entities))
 
-        entities = llm.extract_entities(summary)
-        print(f"Extracted Entities: {entities}")
+            # Entities in the same sentence are related, weighted by how often they appear together
+            relationship_builder.add_text(summary)
+            all_entities.extend(filtered_entities)
 
-        # Filter out common non-entity words (e.g., 'For', 'The', 'and')
-        filtered_entities = [entity for entity in entities if
-                             len(entity) > 1 and entity.lower() not in ["for", "the", "and", "in"]]
-        print(f"Filtered Entities: {filtered_entities}")
-
-        relationships = llm.extract_relationships(filtered_entities)
-        print(f"Extracted Relationships: {relationships}")
-
-        all_entities.extend(filtered_entities)
-        all_relationships.extend(relationships)
+    # Merge name variants (e.g. "Emperor Marcus Aurelius") so each entity becomes a single node
+    with metrics.timer("stage_seconds", stage="canonicalize"):
+        canonicalizer = EntityCanonicalizer()
+        canonical_names = canonicalizer.fit(all_entities)
+        all_relationships = canonicalizer.canonicalize_rows(relationship_builder.triples(), canonical_names)
+    print(f"Extracted {len(all_relationships)} weighted relationships from {len(summaries)} summaries")
 
     # Step 4: Insert extracted entities and relationships into Neo4j
-    neo4j_engine.insert_into_neo4j(all_entities, all_relationships)
+    with metrics.timer("stage_seconds", stage="write"):
+        neo4j_engine.insert_into_neo4j(list(dict.fromkeys(canonical_names[entity] for entity in all_entities)),
+                                       all_relationships)
 
     print("\nKnowledge graph has been successfully inserted into Neo4j.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build a knowledge graph from Wikipedia pages using BART.")
+    add_page_arguments(parser)
+    parser.add_argument("--metrics-out", default=None,
+                        help="Write pipeline metrics to this file, in Prometheus format if it ends in .prom.")
+    args = parser.parse_args()
+    try:
+        main(loader_from_arguments(args))
+    finally:
+        if args.metrics_out:
+            metrics.export(args.metrics_out)
@@ -0,0 +1,65 @@
+"""
+Compares BART summarization throughput of one process using every core against several worker
+processes with a few torch threads each, on the chunks of a Wikipedia page.
+
+    python -m benchmarks.bart_throughput --page "Marcus Aurelius" --configs 1x8 2x4 4x2 8x1
+"""
+import argparse
+import os
+import time
+
+from internal.langchain.wikipedia_api import WikipediaDocumentLoader
+from internal.llm.bart import BartLLM
+from internal.llm.bart_pool import BartWorkerPool
+
+
+def load_chunks(page_title: str, limit: int) -> list[str]:
+    loader = WikipediaDocumentLoader(page_title)
+    chunks = [chunk.page_content for chunk in loader.split_document(loader.load())]
+    return chunks[:limit] if limit else chunks
+
+
+def run_single_process(chunks: list[str], threads: int) -> float:
+    import torch
+
+    torch.set_num_threads(threads)
+    llm = BartLLM(chunks)
+    # Warm-up so that model loading is not part of the measurement
+    llm._bart_pipeline(chunks[0], truncation=True, max_length=60, min_length=10, do_sample=False)
+    start = time.perf_counter()
+    llm.generate_summary()
+    return time.perf_counter() - start
+
+
+def run_worker_pool(chunks: list[str], workers: int, threads: int) -> float:
+    with BartWorkerPool(workers=workers, threads_per_worker=threads) as pool:
+        # One warm-up chunk per worker, so that every worker has loaded the model
+        list(pool.summarize(chunks[:1] * workers))
+        start = time.perf_counter()
+        list(pool.summarize(chunks))
+        return time.perf_counter() - start
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", default="Marcus Aurelius")
+    parser.add_argument("--limit", type=int, default=0, help="Only summarize the first N chunks.")
+    parser.add_argument("--configs", nargs="+", default=[f"1x{cpu_count}", f"{cpu_count}x1"],
+                        help="Configurations as PROCESSESxTHREADS.")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.page, args.limit)
+    print(f"{len(chunks)} chunks from {args.page!r} on {cpu_count} CPUs")
+    for config in args.configs:
+        workers, threads = (int(value) for value in config.split("x"))
+        if workers == 1:
+            elapsed = run_single_process(chunks, threads)
+        else:
+            elapsed = run_worker_pool(chunks, workers, threads)
+        print(f"{workers:>3} processes x {threads:>2} threads: {elapsed:8.2f}s  "
+              f"{len(chunks) / elapsed:6.2f} summaries/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares `TokenChunker` against langchain's `TokenTextSplitter` on large Wikipedia pages.
+
+    python -m benchmarks.chunker --pages "Marcus Aurelius" "Roman Empire" --repeat 20 --offline
+"""
+import argparse
+import time
+
+from langchain.text_splitter import TokenTextSplitter
+
+from internal.langchain.bulk_wikipedia_loader import add_page_arguments, loader_from_arguments
+from internal.langchain.token_chunker import TokenChunker, get_encoding
+
+
+def best_of(function, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_page_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=10, help="Concatenate each page N times to make it larger.")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=128)
+    args = parser.parse_args()
+
+    texts = [document.page_content * args.repeat for document in loader_from_arguments(args).load()]
+    characters = sum(len(text) for text in texts)
+    # Build the encoding outside the measurements, both splitters share tiktoken's cache afterwards
+    get_encoding()
+
+    splitter = TokenTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    chunker = TokenChunker(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    splitter_time = best_of(lambda: [splitter.split_text(text) for text in texts], args.rounds)
+    chunker_time = best_of(lambda: [chunker.chunk_text(text) for text in texts], args.rounds)
+
+    print(f"{len(texts)} pages, {characters / 1e6:.1f}M characters")
+    print(f"TokenTextSplitter: {splitter_time:8.3f}s  {characters / splitter_time / 1e6:6.2f}M chars/sec")
+    print(f"TokenChunker:      {chunker_time:8.3f}s  {characters / chunker_time / 1e6:6.2f}M chars/sec  "
+          f"({splitter_time / chunker_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
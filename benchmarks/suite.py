@@ -0,0 +1,363 @@
+"""
+Times the ingest and retrieval hot paths on synthetic data and saves the results as JSON, so that two
+commits can be compared on the same machine.
+
+    python -m benchmarks.suite --sizes 1000 100000 --save benchmarks/results/baseline.json
+    python -m benchmarks.suite --sizes 1000 100000 --baseline benchmarks/results/baseline.json
+
+The graph cases run against the in-process graph store by default. `--backend neo4j` runs them
+against the dockerized Neo4j from `docker-compose.yml` instead; the synthetic nodes are deleted
+after each case. `structured_retriever` always reads from the in-process graph, since the Neo4j
+query depends on the `entity` fulltext index that only the chatbot setup creates.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import numpy as np
+
+from db.neo4j.neo4j_connector import CSV_HEADERS, DEFAULT_BATCH_SIZE
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+# Row-by-row Neo4j writes take about a millisecond each, so larger sets are only loaded in batches
+DEFAULT_ROW_BY_ROW_LIMIT = 10_000
+# One synthetic sentence per row; above this the generated text no longer fits comfortably in memory
+TEXT_SENTENCE_LIMIT = 1_000_000
+# 256-dimensional float32 vectors take 1 GB per million rows, kept both in memory and in the memory map
+VECTOR_ROW_LIMIT = 1_000_000
+# Vectors are generated and added this many rows at a time
+VECTOR_CHUNK_ROWS = 65_536
+DEFAULT_TOLERANCE = 0.2
+
+FIRST_NAMES = ("Marcus", "Lucius", "Faustina", "Antoninus", "Hadrian", "Commodus", "Galen", "Fronto", "Verus",
+               "Lucilla", "Avidius", "Herodes", "Junius", "Claudius", "Annia", "Domitia")
+LAST_NAMES = ("Aurelius", "Verus", "Pius", "Cassius", "Atticus", "Rusticus", "Maximus", "Severus", "Sabina",
+              "Cornelius", "Pompeianus", "Galeria", "Lucilla", "Fadilla", "Calvisia", "Annius")
+RELATIONSHIPS = ("RELATED_TO", "SON_OF", "MARRIED_TO", "ADOPTED_BY", "EMPEROR_OF", "TUTORED_BY",
+                 "was born in", "co-emperor with", "Succeeded", "FOUGHT_AGAINST")
+
+
+@dataclass
+class Result:
+    name: str
+    seconds: float
+    median_seconds: float
+    items: int = 0
+    unit: str = "rows"
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class Report:
+    backend: str
+    results: dict = field(default_factory=dict)
+    commit: str = ""
+    created: str = ""
+    python: str = platform.python_version()
+    machine: str = f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs"
+
+    def add(self, result: Result):
+        self.results[result.name] = {**asdict(result), "items_per_second": result.items_per_second}
+        print(f"{result.name:<60} {result.seconds:10.4f}s  "
+              f"{result.items_per_second:14,.0f} {result.unit}/sec")
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(asdict(self), file, indent=2, sort_keys=True)
+        print(f"Saved {len(self.results)} results to {path}")
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def entity_name(index: int) -> str:
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)]
+    return f"{first} {last} {index}"
+
+
+def entity_count(rows: int) -> int:
+    return max(rows // 10, 2)
+
+
+def generate_triples_csv(rows: int, directory: str, seed: int = 0) -> str:
+    """
+    Writes `rows` synthetic relationships in the same shape as `relationships.csv`. Entity popularity
+    is skewed, so that a few hub nodes collect most of the relationships as they do in real pages.
+    Files are reused when the same size and seed were generated before.
+    """
+    path = os.path.join(directory, f"triples-{rows}-{seed}.csv")
+    if os.path.exists(path):
+        return path
+
+    rng = random.Random(seed)
+    entities = entity_count(rows)
+    with open(path + ".tmp", "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_HEADERS)
+        for _ in range(rows):
+            source = int(entities * rng.random() ** 2)
+            target = int(entities * rng.random() ** 2)
+            writer.writerow((entity_name(source), rng.choice(RELATIONSHIPS), entity_name(target)))
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def generate_text(sentences: int, seed: int = 0) -> str:
+    """Prose-like text that mentions the synthetic entities, for the extraction and chunking cases."""
+    rng = random.Random(seed)
+    entities = entity_count(sentences)
+    words = ("the", "and", "of", "was", "in", "his", "with", "after", "who", "reign", "war", "letters", "court")
+    text = []
+    for _ in range(sentences):
+        subject, other = entity_name(rng.randrange(entities)), entity_name(rng.randrange(entities))
+        filler = " ".join(rng.choice(words) for _ in range(rng.randint(4, 12)))
+        text.append(f"{subject} {filler} {other} {rng.choice(words)} Rome.")
+    return " ".join(text)
+
+
+def measure(name: str, function: Callable[[], object], rounds: int, items: int = 0, unit: str = "rows",
+            setup: Optional[Callable[[], None]] = None) -> Result:
+    timings = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return Result(name, min(timings), statistics.median(timings), items, unit)
+
+
+class GraphBackend:
+    """Creates an empty graph for each loader case and removes the synthetic data afterwards."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+
+    def fresh(self):
+        self.close()
+        if self.name == "memory":
+            from db.memory.memory_graph import InMemoryGraphEngine
+
+            self.engine = InMemoryGraphEngine()
+        else:
+            from db.neo4j.neo4j_connector import Neo4jEngine
+
+            self.engine = Neo4jEngine(os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+                                      os.getenv("NEO4J_USERNAME", "neo4j"),
+                                      os.getenv("NEO4J_PASSWORD", "your_password"))
+        return self.engine
+
+    def clear(self, rows: int):
+        # Only the synthetic entities are removed, so a database that holds a real graph can be used
+        if self.name != "neo4j" or self.engine is None:
+            return
+        names = [entity_name(index) for index in range(entity_count(rows))]
+        for start in range(0, len(names), DEFAULT_BATCH_SIZE):
+            self.engine.run("UNWIND $names AS name MATCH (n:Entity {name: name}) DETACH DELETE n",
+                            {"names": names[start:start + DEFAULT_BATCH_SIZE]})
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+
+def run_loader_cases(report: Report, backend: GraphBackend, path: str, rows: int, rounds: int,
+                     row_by_row_limit: int):
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+
+    loaders = {
+        "store_named_relationships_from_file": lambda engine, batch_size:
+            engine.store_named_relationships_from_file(path, batch_size),
+        "store_named_relationships_from_string": lambda engine, batch_size:
+            engine.store_named_relationships_from_string(content, batch_size),
+        "store_in_neo4j_csv": lambda engine, batch_size: engine.store_in_neo4j_csv(path, batch_size),
+    }
+    # The in-process store has no round trips, so it only has one write path
+    modes = {"batched": DEFAULT_BATCH_SIZE}
+    if backend.name == "neo4j" and rows <= row_by_row_limit:
+        modes["row_by_row"] = None
+
+    for loader_name, loader in loaders.items():
+        for mode, batch_size in modes.items():
+            def setup():
+                backend.fresh()
+                backend.clear(rows)
+
+            try:
+                report.add(measure(f"{backend.name}/{loader_name}/{mode}/{rows}",
+                                   lambda: loader(backend.engine, batch_size), rounds, rows, setup=setup))
+            finally:
+                backend.clear(rows)
+                backend.close()
+
+
+def run_extraction_cases(report: Report, sentences: int, rounds: int):
+    from internal.llm.entity_extractor import entity_extractor
+    from internal.llm.llm import LLMBase
+
+    text = generate_text(sentences)
+    entities = LLMBase.extract_entities(text)
+    report.add(measure(f"extract_entities/{sentences}", lambda: LLMBase.extract_entities(text), rounds,
+                       len(text), "chars"))
+    report.add(measure(f"extract_relationships/{sentences}", lambda: LLMBase.extract_relationships(entities),
+                       rounds, len(entities), "entities"))
+    report.add(measure(f"entity_extractor/{sentences}", lambda: entity_extractor.extract(text), rounds,
+                       len(text), "chars"))
+
+
+def run_chunker_cases(report: Report, sentences: int, rounds: int):
+    from internal.langchain.token_chunker import TokenChunker, get_encoding
+
+    text = generate_text(sentences)
+    # Loading the BPE ranks is a one-off cost, it is not part of the measurement
+    get_encoding()
+    chunker = TokenChunker(chunk_size=512, chunk_overlap=128)
+    report.add(measure(f"token_chunker/{sentences}", lambda: chunker.chunk_text(text), rounds, len(text),
+                       "chars"))
+
+
+def run_retriever_cases(report: Report, path: str, rows: int, rounds: int, questions: int = 100):
+    from langchain_core.runnables import RunnableLambda
+
+    from db.memory.memory_graph import InMemoryGraphEngine
+    from internal.langchain.Queries import Queries
+    from internal.llm.Entities import Entities
+
+    graph = InMemoryGraphEngine()
+    graph.store_named_relationships_from_file(path)
+    rng = random.Random(rows)
+    # A fixed entity chain keeps the LLM call out of the measurement
+    mentions = itertools.cycle([[entity_name(rng.randrange(entity_count(rows))) for _ in range(2)]
+                                for _ in range(questions)])
+    queries = Queries(RunnableLambda(lambda _: Entities(names=next(mentions))), None, graph)
+
+    def ask_all():
+        for _ in range(questions):
+            queries.structured_retriever("Who are they?")
+
+    report.add(measure(f"structured_retriever/{rows}", ask_all, rounds, questions, "questions"))
+
+
+def run_vector_cases(report: Report, rows: int, rounds: int, directory: str, dimensions: int = 256,
+                     queries: int = 100):
+    from internal.langchain.vector_index import NumpyVectorIndex
+
+    # Clustered random vectors, which an inverted file index handles like real embeddings
+    rng = np.random.default_rng(rows)
+    centers = rng.standard_normal((max(rows // 400, 1), dimensions), dtype=np.float32)
+    target_rows = np.sort(rng.integers(0, rows, queries))
+    targets = []
+    with tempfile.TemporaryDirectory(prefix=f"vectors-{rows}-", dir=directory) as path:
+        index = NumpyVectorIndex(path=path)
+        # No background index build while loading or during the exact cases
+        index.ivf_threshold = rows + 1
+        for start in range(0, rows, VECTOR_CHUNK_ROWS):
+            count = min(VECTOR_CHUNK_ROWS, rows - start)
+            vectors = centers[rng.integers(0, len(centers), count)]
+            vectors += 0.6 * rng.standard_normal((count, dimensions), dtype=np.float32)
+            index.add_embeddings([f"document {row}" for row in range(start, start + count)], vectors)
+            picked = target_rows[(target_rows >= start) & (target_rows < start + count)] - start
+            targets.extend(vectors[picked])
+        targets = np.asarray(targets) + 0.3 * rng.standard_normal((queries, dimensions), dtype=np.float32)
+
+        def search_each():
+            for target in targets:
+                index.search_batch([target], k=4)
+
+        report.add(measure(f"vector_search/exact/{rows}", search_each, rounds, queries, "queries"))
+        report.add(measure(f"vector_search/exact_batch/{rows}", lambda: index.search_batch(targets, k=4), rounds,
+                           queries, "queries"))
+        index.ivf_threshold = 0
+        # Builds the inverted file index outside the measurement
+        index.build_index()
+        report.add(measure(f"vector_search/ivf/{rows}", search_each, rounds, queries, "queries"))
+
+
+def compare(report: Report, baseline_path: str, tolerance: float) -> list[str]:
+    """Prints the change of every case against a saved report and returns the ones slower than `tolerance`."""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit') or 'unknown'}):")
+
+    regressions = []
+    for name, result in report.results.items():
+        previous = baseline["results"].get(name)
+        if previous is None or not previous["seconds"]:
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<60} {previous['seconds']:10.4f}s -> {result['seconds']:10.4f}s  {ratio:5.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Numbers of synthetic relationships, up to 10M.")
+    parser.add_argument("--backend", choices=("memory", "neo4j"), default="memory")
+    parser.add_argument("--cases", nargs="+", default=("loaders", "extraction", "chunker", "retriever", "vector"),
+                        choices=("loaders", "extraction", "chunker", "retriever", "vector"))
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--row-by-row-limit", type=int, default=DEFAULT_ROW_BY_ROW_LIMIT,
+                        help="Largest size for which the row-by-row Neo4j loaders are timed.")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "graph-benchmarks"),
+                        help="Where the generated CSV files are kept between runs.")
+    parser.add_argument("--save", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="Compare with the results in this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Slowdown, as a fraction, above which a case counts as a regression.")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = Report(args.backend, commit=current_commit(),
+                    created=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    backend = GraphBackend(args.backend)
+    for rows in args.sizes:
+        path = generate_triples_csv(rows, args.data_dir)
+        if "loaders" in args.cases:
+            run_loader_cases(report, backend, path, rows, args.rounds, args.row_by_row_limit)
+        if "extraction" in args.cases and rows <= TEXT_SENTENCE_LIMIT:
+            run_extraction_cases(report, rows, args.rounds)
+        if "chunker" in args.cases and rows <= TEXT_SENTENCE_LIMIT:
+            run_chunker_cases(report, rows, args.rounds)
+        if "retriever" in args.cases:
+            run_retriever_cases(report, path, rows, args.rounds)
+        if "vector" in args.cases and rows <= VECTOR_ROW_LIMIT:
+            run_vector_cases(report, rows, args.rounds, args.data_dir)
+
+    if args.save:
+        report.save(args.save)
+    if args.baseline and compare(report, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,8 +19,14 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_core.runnables import RunnableParallel, RunnablePassthrough
 from typing import Tuple, List
 
+from db.events import notify_graph_changed
 from internal.langchain.Queries import Queries
+from internal.langchain.embedding_store import CachedEmbeddings, sync_document_embeddings
+from internal.langchain.vector_index import NumpyVectorIndex
+from internal.langchain.gazetteer import Gazetteer, entity_ids_loader
+from internal.langchain.retrieval_cache import RetrievalCache
 from internal.llm.Entities import Entities
+from internal.metrics.metrics import metrics
 
 os.environ["NEO4J_URI"] = "bolt://localhost:7687"
 os.environ["NEO4J_USERNAME"] = "neo4j"
@@ -56,6 +62,7 @@ def wikipedia_loader(llm_transformer: LLMGraphTransformer, flag: bool = True):
         baseEntityLabel=True,
         include_source=True
     )
+    notify_graph_changed()
 
 
 def _format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
@@ -122,9 +129,10 @@ def chat_with_bot(chain):
             print("Chatbot: Goodbye!")
             break
 
-        response = chain.invoke(
-            {"question": user_input, "chat_history": chat_history}
-        )
+        with metrics.timer("chat_turn_seconds", "Latency of one chatbot answer."):
+            response = chain.invoke(
+                {"question": user_input, "chat_history": chat_history}
+            )
         print(f"Chatbot: {response}")
 
         # Update chat history
@@ -138,20 +146,33 @@ if __name__ == '__main__':
     llm_transformer = LLMGraphTransformer(llm=llm)
     wikipedia_loader(llm_transformer, is_database_empty())
 
-    vector_index = Neo4jVector.from_existing_graph(
-        OpenAIEmbeddings(),
-        search_type="hybrid",
-        node_label="Document",
-        text_node_properties=["text"],
-        embedding_node_property="embedding"
-    )
+    # Vectors computed in earlier runs are read from .embedding_store, only new Document text is embedded
+    embeddings = CachedEmbeddings(OpenAIEmbeddings())
+    sync_document_embeddings(graph, embeddings)
+    # VECTOR_BACKEND=numpy answers similarity searches from a local copy of the Document embeddings
+    if os.getenv("VECTOR_BACKEND") == "numpy":
+        vector_index = NumpyVectorIndex.from_graph(graph, embeddings)
+    else:
+        vector_index = Neo4jVector.from_existing_graph(
+            embeddings,
+            search_type="hybrid",
+            node_label="Document",
+            text_node_properties=["text"],
+            embedding_node_property="embedding"
+        )
 
     # Retriever
     graph.query(
         "CREATE FULLTEXT INDEX entity IF NOT EXISTS FOR (e:__Entity__) ON EACH [e.id]")
 
-    entity_chain = Entities.get_entity_chain(llm)
-    query_generator = Queries(entity_chain, vector_index, graph)
+    # Entity names already in the graph are matched locally, the LLM only sees questions without any
+    entity_chain = Gazetteer(entity_ids_loader(graph)).as_entity_chain(Entities.get_entity_chain(llm))
+    query_generator = Queries(entity_chain, vector_index, graph, cache=RetrievalCache())
 
     print(query_generator.structured_retriever("Who is Marcus Aurelius?"))
-    chat_with_bot(generating_chain())
+    try:
+        chat_with_bot(generating_chain())
+    finally:
+        # METRICS_OUT=metrics.prom exports turn and retriever latencies when the chat ends
+        if os.getenv("METRICS_OUT"):
+            metrics.export(os.getenv("METRICS_OUT"))
@@ -0,0 +1,64 @@
+import contextvars
+import functools
+import threading
+import weakref
+from typing import Callable
+
+_listeners: list = []
+_lock = threading.Lock()
+# How many graph writes the current thread or task is inside; only the outermost one notifies
+_write_depth = contextvars.ContextVar("graph_write_depth", default=0)
+
+
+def on_graph_changed(callback: Callable[[], None]):
+    """
+    Registers `callback` to run after every write to the graph made by this process.
+
+    Bound methods are held weakly, so a cache that subscribes itself does not outlive its owner.
+    """
+    reference = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+    with _lock:
+        _listeners.append(reference)
+
+
+def notify_graph_changed():
+    """Runs every registered callback. Ingest code that writes to the graph without an engine calls this directly."""
+    with _lock:
+        _listeners[:] = [reference for reference in _listeners if reference() is not None]
+        callbacks = [reference() for reference in _listeners]
+    for callback in callbacks:
+        if callback is not None:
+            callback()
+
+
+def graph_write(method):
+    """
+    Marks an engine method as a graph write, notifying the listeners once it returns or raises. A write
+    that calls another write notifies once, when the outer one finishes.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        token = _write_depth.set(_write_depth.get() + 1)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _write_depth.reset(token)
+            if _write_depth.get() == 0:
+                notify_graph_changed()
+
+    return wrapper
+
+
+def async_graph_write(method):
+    """`graph_write` for coroutine methods."""
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = _write_depth.set(_write_depth.get() + 1)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            _write_depth.reset(token)
+            if _write_depth.get() == 0:
+                notify_graph_changed()
+
+    return wrapper
@@ -0,0 +1,314 @@
+import csv
+import io
+import re
+import time
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional, Sequence
+
+from db.events import graph_write
+from db.neo4j.neo4j_connector import (
+    DEFAULT_BATCH_SIZE,
+    ENTITY_LABEL,
+    ROWS_PER_SECOND,
+    ROWS_SKIPPED,
+    ROWS_WRITTEN,
+    read_relationship_rows,
+    sanitize_relationship_type,
+    validate_batch_size,
+)
+from internal.metrics.metrics import metrics
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _tokens(text: str) -> list[str]:
+    return [token.casefold() for token in _TOKEN_PATTERN.findall(text)]
+
+
+@dataclass
+class _Adjacency:
+    """Compressed sparse row adjacency: the neighbors of node `i` are `targets[offsets[i]:offsets[i + 1]]`."""
+    offsets: array
+    targets: array
+    edges: array
+
+    @classmethod
+    def build(cls, node_count: int, sources: array, targets: array) -> "_Adjacency":
+        # Counting sort over the source ids, O(nodes + edges).
+        offsets = array('q', bytes(8 * (node_count + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for i in range(node_count):
+            offsets[i + 1] += offsets[i]
+
+        cursor = array('q', offsets[:-1])
+        sorted_targets = array('q', bytes(8 * len(sources)))
+        sorted_edges = array('q', bytes(8 * len(sources)))
+        for edge, (source, target) in enumerate(zip(sources, targets)):
+            position = cursor[source]
+            sorted_targets[position] = target
+            sorted_edges[position] = edge
+            cursor[source] = position + 1
+        return cls(offsets, sorted_targets, sorted_edges)
+
+    def neighbors(self, node: int) -> Iterator[tuple[int, int]]:
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return zip(self.targets[start:end], self.edges[start:end])
+
+
+@dataclass
+class InMemoryGraphEngine:
+    """
+    Pure-Python graph store with the same write interface as `Neo4jEngine`.
+
+    Node names are interned to integer ids and edges are appended to flat arrays. Neighborhood queries
+    go through CSR adjacency that is rebuilt lazily after writes, so ingest stays append-only and
+    lookups are slices of contiguous arrays.
+
+    Cypher is not supported: there is no `run`, so code that sends queries has to check for this
+    engine, as `GraphBackend.clear` in the benchmarks and `Queries` do.
+    """
+    _node_ids: dict[str, int] = field(init=False, default_factory=dict, repr=False)
+    _names: list[str] = field(init=False, default_factory=list, repr=False)
+    _labels: list[set] = field(init=False, default_factory=list, repr=False)
+    _properties: list[dict] = field(init=False, default_factory=list, repr=False)
+    _type_ids: dict[str, int] = field(init=False, default_factory=dict, repr=False)
+    _types: list[str] = field(init=False, default_factory=list, repr=False)
+    _edge_sources: array = field(init=False, default_factory=lambda: array('q'), repr=False)
+    _edge_targets: array = field(init=False, default_factory=lambda: array('q'), repr=False)
+    _edge_types: array = field(init=False, default_factory=lambda: array('q'), repr=False)
+    _edge_properties: dict[int, dict] = field(init=False, default_factory=dict, repr=False)
+    _edge_keys: set = field(init=False, default_factory=set, repr=False)
+    _token_index: dict[str, set] = field(init=False, default_factory=dict, repr=False)
+    _outgoing: Optional[_Adjacency] = field(init=False, default=None, repr=False)
+    _incoming: Optional[_Adjacency] = field(init=False, default=None, repr=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        pass
+
+    @property
+    def node_count(self) -> int:
+        return len(self._names)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._edge_sources)
+
+    def node_names(self) -> list[str]:
+        return list(self._names)
+
+    # Writes
+
+    def _merge_node(self, name: str, label: str = ENTITY_LABEL) -> int:
+        node = self._node_ids.get(name)
+        if node is None:
+            node = len(self._names)
+            self._node_ids[name] = node
+            self._names.append(name)
+            self._labels.append({ENTITY_LABEL})
+            self._properties.append({"name": name})
+            for token in _tokens(name):
+                self._token_index.setdefault(token, set()).add(node)
+            self._outgoing = self._incoming = None
+        self._labels[node].add(label)
+        return node
+
+    def _merge_edge(self, source: int, target: int, relationship_type: str, properties: Optional[dict] = None):
+        type_id = self._type_ids.get(relationship_type)
+        if type_id is None:
+            type_id = len(self._types)
+            self._type_ids[relationship_type] = type_id
+            self._types.append(relationship_type)
+
+        key = (source, type_id, target, tuple(sorted(properties.items())) if properties else None)
+        if key in self._edge_keys:
+            return
+        self._edge_keys.add(key)
+        if properties:
+            self._edge_properties[len(self._edge_sources)] = properties
+        self._edge_sources.append(source)
+        self._edge_targets.append(target)
+        self._edge_types.append(type_id)
+        self._outgoing = self._incoming = None
+
+    @graph_write
+    def create_node(self, node_type, properties):
+        node = self._merge_node(properties["name"], node_type)
+        self._properties[node].update(properties)
+
+    @graph_write
+    def create_relationship(self, source, target, relationship):
+        # Like the Cypher MATCH in Neo4jEngine, nothing is created when either endpoint is missing.
+        if source in self._node_ids and target in self._node_ids:
+            self._merge_edge(self._node_ids[source], self._node_ids[target], relationship)
+
+    @graph_write
+    def insert_into_neo4j(self, entities, relationships):
+        for entity in entities:
+            self._merge_node(entity)
+        for relationship in relationships:
+            self.create_relationship(relationship['entity1'], relationship['entity2'],
+                                     sanitize_relationship_type(relationship['relationship_type']))
+
+    @graph_write
+    def create_node_updated(self, name):
+        self._merge_node(name)
+
+    @graph_write
+    def create_relationship_updated(self, source, target, relationship_type):
+        if source in self._node_ids and target in self._node_ids:
+            self._merge_edge(self._node_ids[source], self._node_ids[target], "RELATIONSHIP",
+                             {"type": relationship_type})
+
+    @graph_write
+    def store_in_neo4j(self, relationships: list):
+        self.store_relationships_batched(
+            ((rel.get('source'), rel.get('relationship'), rel.get('target')) for rel in relationships),
+            named=False)
+
+    @graph_write
+    def store_relationships_batched(self, rows: Iterable[Sequence[str]], batch_size: int = DEFAULT_BATCH_SIZE,
+                                    named: bool = True) -> int:
+        """
+        Stores `(source, relationship, target)` rows. `batch_size` is only validated for parity with
+        `Neo4jEngine`, since there are no round trips to amortize.
+        """
+        validate_batch_size(batch_size)
+        total = 0
+        start = time.perf_counter()
+        for source, relationship, target in rows:
+            if not (source and relationship and target):
+                metrics.inc(ROWS_SKIPPED, backend="memory")
+                continue
+            source_id, target_id = self._merge_node(source), self._merge_node(target)
+            if named:
+                self._merge_edge(source_id, target_id, sanitize_relationship_type(relationship))
+            else:
+                self._merge_edge(source_id, target_id, "RELATED", {"type": relationship})
+            total += 1
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else float(total)
+        metrics.inc(ROWS_WRITTEN, total, backend="memory")
+        metrics.set(ROWS_PER_SECOND, rate, backend="memory")
+        print(f"Stored {total} relationships in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+        return total
+
+    @graph_write
+    def store_named_relationships_from_string(self, csv_content: str, batch_size: Optional[int] = None):
+        """
+        Stores named relationships from a CSV string.
+
+        :param csv_content: A string containing the CSV data with headers `source, relationship, target`.
+        """
+        self.store_relationships_batched(read_relationship_rows(io.StringIO(csv_content)),
+                                         batch_size or DEFAULT_BATCH_SIZE)
+
+    @graph_write
+    def store_named_relationships_from_file(self, csv_file_path: str, batch_size: Optional[int] = None):
+        """
+        Stores named relationships from a CSV file.
+
+        :param csv_file_path: Path to the CSV file containing relationships with headers `source, relationship, target`.
+        """
+        with open(csv_file_path, mode='r', encoding='utf-8') as file:
+            self.store_relationships_batched(read_relationship_rows(file), batch_size or DEFAULT_BATCH_SIZE)
+
+    @graph_write
+    def store_in_neo4j_csv(self, csv_file_path: str, batch_size: Optional[int] = None):
+        """
+        Stores relationships from a CSV file as `RELATED {type: ...}` relationships.
+
+        :param csv_file_path: Path to the CSV file containing relationships
+        """
+        with open(csv_file_path, mode='r', encoding='utf-8') as file:
+            rows = ((rel.get('source'), rel.get('relationship'), rel.get('target'))
+                    for rel in csv.DictReader(file))
+            self.store_relationships_batched(rows, batch_size or DEFAULT_BATCH_SIZE, named=False)
+
+    # Reads
+
+    def _adjacency(self) -> tuple[_Adjacency, _Adjacency]:
+        if self._outgoing is None:
+            self._outgoing = _Adjacency.build(self.node_count, self._edge_sources, self._edge_targets)
+            self._incoming = _Adjacency.build(self.node_count, self._edge_targets, self._edge_sources)
+        return self._outgoing, self._incoming
+
+    def neighbors(self, name: str, direction: str = "both") -> list[str]:
+        """
+        Returns the names of the nodes one hop away from `name`.
+
+        :param direction: `out`, `in` or `both`.
+        """
+        node = self._node_ids.get(name)
+        if node is None:
+            return []
+        return [self._names[neighbor] for neighbor in self._neighbor_ids(node, direction)]
+
+    def _neighbor_ids(self, node: int, direction: str) -> set:
+        outgoing, incoming = self._adjacency()
+        neighbors = set()
+        if direction in ("out", "both"):
+            neighbors.update(target for target, _ in outgoing.neighbors(node))
+        if direction in ("in", "both"):
+            neighbors.update(source for source, _ in incoming.neighbors(node))
+        return neighbors
+
+    def neighborhood(self, name: str, hops: int = 1, direction: str = "both") -> set[str]:
+        """Returns the names of every node within `hops` hops of `name`, excluding `name` itself."""
+        node = self._node_ids.get(name)
+        if node is None:
+            return set()
+        seen = {node}
+        frontier = {node}
+        for _ in range(hops):
+            frontier = {neighbor for current in frontier
+                        for neighbor in self._neighbor_ids(current, direction)} - seen
+            seen |= frontier
+        seen.discard(node)
+        return {self._names[neighbor] for neighbor in seen}
+
+    def relationship_lines(self, name: str, limit: int = 50) -> list[str]:
+        """Formats the one-hop neighborhood of `name` the same way `Queries.structured_retriever` does."""
+        node = self._node_ids.get(name)
+        if node is None:
+            return []
+        outgoing, incoming = self._adjacency()
+        lines = []
+        for target, edge in outgoing.neighbors(node):
+            lines.append(f"{name} - {self._types[self._edge_types[edge]]} -> {self._names[target]}")
+        for source, edge in incoming.neighbors(node):
+            lines.append(f"{self._names[source]} - {self._types[self._edge_types[edge]]} -> {name}")
+        return lines[:limit]
+
+    def search_nodes(self, text: str, limit: int = 2) -> list[str]:
+        """
+        Token-overlap stand-in for the `entity` fulltext index: ranks nodes by how many of the
+        query's tokens appear in their name.
+        """
+        scores: dict[int, int] = {}
+        for token in set(_tokens(text)):
+            for node in self._token_index.get(token, ()):
+                scores[node] = scores.get(node, 0) + 1
+        ranked = sorted(scores, key=lambda node: (-scores[node], len(self._names[node])))
+        return [self._names[node] for node in ranked[:limit]]
+
+    def fulltext_neighborhood(self, text: str, limit: int = 2, output_limit: int = 50) -> list[str]:
+        """In-memory equivalent of the fulltext-plus-neighborhood query in `Queries.structured_retriever`."""
+        lines = []
+        for name in self.search_nodes(text, limit):
+            lines.extend(self.relationship_lines(name, output_limit))
+        return lines[:output_limit]
+
+    def batched_fulltext_neighborhood(self, texts: Sequence[str], limit: int = 2,
+                                      output_limit: int = 50) -> Iterator[str]:
+        """Yields the `fulltext_neighborhood` lines of each text in turn, the counterpart of one UNWIND query."""
+        for text in texts:
+            yield from self.fulltext_neighborhood(text, limit, output_limit)
@@ -0,0 +1,259 @@
+import asyncio
+import io
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional, Sequence, Union
+
+from neo4j import AsyncDriver, AsyncGraphDatabase, Record
+
+from db.events import async_graph_write
+from db.neo4j.neo4j_connector import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CONNECTION_ACQUISITION_TIMEOUT,
+    DEFAULT_FETCH_SIZE,
+    DEFAULT_MAX_CONNECTION_LIFETIME,
+    DEFAULT_MAX_CONNECTION_POOL_SIZE,
+    BATCH_WRITE_SECONDS,
+    ENTITY_LABEL,
+    ENTITY_NAME_CONSTRAINT_QUERY,
+    ENTITY_NAME_INDEX_QUERY,
+    ROWS_PER_SECOND,
+    ROWS_WRITTEN,
+    build_label_index_query,
+    group_batch_queries,
+    read_relationship_rows,
+    validate_batch_size,
+)
+from internal.metrics.metrics import metrics
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+Triples = Union[AsyncIterable[Sequence[str]], Iterable[Sequence[str]]]
+
+
+async def _as_async_iterator(rows: Triples) -> AsyncIterator[Sequence[str]]:
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+async def _abatched(rows: Triples, batch_size: int) -> AsyncIterator[list]:
+    batch = []
+    async for row in _as_async_iterator(rows):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _write_relationship_batch(tx, batch: Sequence[Sequence[str]], named: bool):
+    for query, rows in group_batch_queries(batch, named):
+        result = await tx.run(query, {"rows": rows})
+        await result.consume()
+
+
+@dataclass
+class AsyncNeo4jEngine:
+    """Asyncio counterpart of `Neo4jEngine` that runs up to `max_concurrency` write transactions at once."""
+    uri: str
+    user: str
+    password: str
+    database: Optional[str] = None
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    max_connection_pool_size: int = DEFAULT_MAX_CONNECTION_POOL_SIZE
+    connection_acquisition_timeout: float = DEFAULT_CONNECTION_ACQUISITION_TIMEOUT
+    max_connection_lifetime: float = DEFAULT_MAX_CONNECTION_LIFETIME
+    fetch_size: int = DEFAULT_FETCH_SIZE
+    bootstrap_schema: bool = True
+    driver: Optional[AsyncDriver] = field(init=False, default=None)
+    _semaphore: Optional[asyncio.Semaphore] = field(init=False, default=None, repr=False)
+    _indexed_labels: set = field(init=False, default_factory=set, repr=False)
+
+    def __post_init__(self):
+        if self.max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {self.max_concurrency}.")
+        self.driver = AsyncGraphDatabase.driver(
+            self.uri, auth=(self.user, self.password),
+            max_connection_pool_size=self.max_connection_pool_size,
+            connection_acquisition_timeout=self.connection_acquisition_timeout,
+            max_connection_lifetime=self.max_connection_lifetime,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self.driver:
+            await self.driver.close()
+            self.driver = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so that it binds to the running event loop rather than the constructing one.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _session(self):
+        return self.driver.session(database=self.database, fetch_size=self.fetch_size)
+
+    async def ensure_schema(self):
+        """Idempotently creates the uniqueness constraint on `:Entity(name)`, see `Neo4jEngine.ensure_schema`."""
+        if not self.bootstrap_schema or ENTITY_LABEL in self._indexed_labels:
+            return
+        async with self.driver.session(database=self.database) as session:
+            try:
+                await (await session.run(ENTITY_NAME_CONSTRAINT_QUERY)).consume()
+            except Exception as e:
+                print(f"Could not create uniqueness constraint on :Entity(name), using an index instead: {e}")
+                await (await session.run(ENTITY_NAME_INDEX_QUERY)).consume()
+        self._indexed_labels.add(ENTITY_LABEL)
+
+    async def ensure_label_index(self, label: str):
+        """Idempotently creates a `name` index for a node label produced by `create_node`."""
+        if not self.bootstrap_schema or label in self._indexed_labels:
+            return
+        async with self.driver.session(database=self.database) as session:
+            await (await session.run(build_label_index_query(label))).consume()
+        self._indexed_labels.add(label)
+
+    async def run(self, query, parameters=None) -> list[Record]:
+        """Runs a query and consumes every record before the session is closed."""
+        await self.ensure_schema()
+        async with self.semaphore:
+            async with self._session() as session:
+                result = await session.run(query, parameters or {})
+                return [record async for record in result]
+
+    @async_graph_write
+    async def create_node(self, node_type, properties):
+        await self.ensure_label_index(node_type)
+        query = f"""
+        MERGE (n:Entity {{name: $name}})
+        SET n:`{node_type}`
+        SET n += $props
+        RETURN n
+        """
+        await self.run(query, {"name": properties["name"], "props": properties})
+
+    @async_graph_write
+    async def create_relationship(self, source, target, relationship):
+        query = f"""
+        MATCH (a:Entity {{name: $source}}), (b:Entity {{name: $target}})
+        MERGE (a)-[r:{relationship}]->(b)
+        RETURN r
+        """
+        await self.run(query, {"source": source, "target": target})
+
+    async def _write_batch(self, batch: list, named: bool):
+        async with self._session() as session:
+            await session.execute_write(_write_relationship_batch, batch, named)
+
+    @async_graph_write
+    async def store_triples(self, triples: Triples, batch_size: int = DEFAULT_BATCH_SIZE,
+                            named: bool = True) -> int:
+        """
+        Stores `(source, relationship, target)` triples from a sync or async iterable, running up to
+        `max_concurrency` batch transactions concurrently. Reading from `triples` pauses while every
+        slot is busy, so a slow writer applies backpressure to the producer.
+
+        Concurrent MERGEs on the same nodes may deadlock; the driver retries those transactions.
+
+        :param triples: Any iterable or async iterable of `(source, relationship, target)` rows.
+        :param batch_size: Number of rows per transaction, up to `MAX_BATCH_SIZE`.
+        :param named: Store the relationship as its own sanitized type, otherwise as `RELATED {type: ...}`.
+        :return: The number of rows written.
+        """
+        validate_batch_size(batch_size)
+        await self.ensure_schema()
+        total = 0
+        start = time.perf_counter()
+        pending = set()
+        failures = []
+        # Bounds the batches read ahead of the writes. The engine-wide semaphore is only held while a
+        # batch is written, so a task cancelled before it starts never takes one of its permits.
+        window = asyncio.Semaphore(self.max_concurrency)
+
+        async def write(batch):
+            nonlocal total
+            async with self.semaphore:
+                with metrics.timer(BATCH_WRITE_SECONDS):
+                    await self._write_batch(batch, named)
+            # Only rows whose transaction committed are counted
+            total += len(batch)
+            metrics.inc(ROWS_WRITTEN, len(batch))
+
+        def finished(task: asyncio.Task):
+            # Also runs for tasks cancelled before they started
+            window.release()
+            pending.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                failures.append(task.exception())
+
+        try:
+            async for batch in _abatched(triples, batch_size):
+                await window.acquire()
+                # Stop reading as soon as a batch has failed instead of writing the rest of the input
+                if failures:
+                    window.release()
+                    raise failures[0]
+                task = asyncio.create_task(write(batch))
+                pending.add(task)
+                task.add_done_callback(finished)
+            await asyncio.gather(*pending, return_exceptions=True)
+            if failures:
+                raise failures[0]
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else float(total)
+        metrics.set(ROWS_PER_SECOND, rate)
+        print(f"Stored {total} relationships in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+        return total
+
+    async def store_in_neo4j(self, relationships: list, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        triples = (
+            (rel.get('source'), rel.get('relationship'), rel.get('target'))
+            for rel in relationships
+            if rel.get('source') and rel.get('relationship') and rel.get('target')
+        )
+        return await self.store_triples(triples, batch_size, named=False)
+
+    async def store_named_relationships_from_string(self, csv_content: str,
+                                                    batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Stores named relationships in Neo4j from a CSV string.
+
+        :param csv_content: A string containing the CSV data with headers `source, relationship, target`.
+        """
+        return await self.store_triples(read_relationship_rows(io.StringIO(csv_content)), batch_size)
+
+    async def store_named_relationships_from_file(self, csv_file_path: str,
+                                                  batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Stores named relationships in Neo4j from a CSV file.
+
+        :param csv_file_path: Path to the CSV file containing relationships with headers `source, relationship, target`.
+        """
+        with open(csv_file_path, mode='r', encoding='utf-8') as file:
+            return await self.store_triples(read_relationship_rows(file), batch_size)
+
+    async def store_in_neo4j_csv(self, csv_file_path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Stores relationships in Neo4j from a CSV file as `RELATED {type: ...}` relationships.
+
+        :param csv_file_path: Path to the CSV file containing relationships
+        """
+        with open(csv_file_path, mode='r', encoding='utf-8') as file:
+            return await self.store_triples(read_relationship_rows(file), batch_size, named=False)
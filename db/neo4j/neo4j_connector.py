@@ -1,9 +1,16 @@
 import csv
 import io
 import re
+import threading
+import time
 from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Sequence
 
-from neo4j import GraphDatabase
+from neo4j import Driver, GraphDatabase, Record
+
+from db.events import graph_write
+from internal.metrics.metrics import metrics
 
 # Load Neo4j credentials from environment variables
 import os
@@ -16,84 +23,306 @@ NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "your_password")
 
+DEFAULT_MAX_CONNECTION_POOL_SIZE = 100
+DEFAULT_CONNECTION_ACQUISITION_TIMEOUT = 60.0
+DEFAULT_MAX_CONNECTION_LIFETIME = 3600.0
+DEFAULT_FETCH_SIZE = 1000
+
+# One driver (and therefore one connection pool) per distinct connection configuration in the process.
+_shared_drivers: dict[tuple, Driver] = {}
+_shared_driver_refs: dict[tuple, int] = {}
+_shared_drivers_lock = threading.Lock()
+
+
+def acquire_shared_driver(uri: str, user: str, password: str, **pool_config) -> tuple[tuple, Driver]:
+    """
+    Returns the process-wide driver for the given connection settings, creating it on first use.
+
+    :return: The registry key, to be handed back to `release_shared_driver`, and the driver.
+    """
+    key = (uri, user, password, tuple(sorted(pool_config.items())))
+    with _shared_drivers_lock:
+        driver = _shared_drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(uri, auth=(user, password), **pool_config)
+            _shared_drivers[key] = driver
+            _shared_driver_refs[key] = 0
+        _shared_driver_refs[key] += 1
+    return key, driver
+
+
+def release_shared_driver(key: tuple):
+    """Drops one reference to a shared driver and closes it once nobody uses it anymore."""
+    with _shared_drivers_lock:
+        if key not in _shared_drivers:
+            return
+        _shared_driver_refs[key] -= 1
+        if _shared_driver_refs[key] > 0:
+            return
+        driver = _shared_drivers.pop(key)
+        del _shared_driver_refs[key]
+    driver.close()
+
+
+ROWS_PROCESSED = "neo4j_rows_processed_total"
+ROWS_SKIPPED = "neo4j_rows_skipped_total"
+ROWS_WRITTEN = "neo4j_rows_written_total"
+ROWS_PER_SECOND = "neo4j_rows_per_second"
+BATCH_WRITE_SECONDS = "neo4j_batch_write_seconds"
+metrics.describe(ROWS_PROCESSED, "Relationship rows written to Neo4j one by one.")
+metrics.describe(ROWS_SKIPPED, "Relationship rows skipped as invalid.")
+metrics.describe(ROWS_WRITTEN, "Relationship rows written to Neo4j in batches.")
+metrics.describe(ROWS_PER_SECOND, "Throughput of the last batched ingest.")
+metrics.describe(BATCH_WRITE_SECONDS, "Duration of one batched write transaction.")
+
+CSV_HEADERS = ["source", "relationship", "target"]
+DEFAULT_BATCH_SIZE = 10_000
+MAX_BATCH_SIZE = 50_000
+
+
+def sanitize_relationship_type(relationship: str) -> str:
+    """Turns free-form relationship text into a valid Cypher relationship type."""
+    return re.sub(r"[^a-zA-Z0-9_]", "_", relationship).upper()
+
+
+def validate_batch_size(batch_size: int):
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}, got {batch_size}.")
+
+
+def batched(rows: Iterable, batch_size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def read_relationship_rows(csv_file) -> Iterator[tuple[str, str, str]]:
+    """
+    Yields `(source, relationship, target)` rows from a CSV file object, skipping malformed rows.
+
+    :param csv_file: A file object with headers `source, relationship, target`.
+    """
+    reader = csv.reader(csv_file)
+    headers = next(reader, None)
+    if headers != CSV_HEADERS:
+        raise ValueError("CSV must have 'source', 'relationship', and 'target' as headers.")
+
+    for row in reader:
+        if len(row) != 3 or not all(row):
+            metrics.inc(ROWS_SKIPPED)
+            continue
+        yield row[0], row[1], row[2]
+
+
+def build_named_batch_query(relationship_type: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    MERGE (a:Entity {{name: row.source}})
+    MERGE (b:Entity {{name: row.target}})
+    MERGE (a)-[r:`{relationship_type}`]->(b)
+    """
+
+
+INSERT_ENTITIES_QUERY = """
+UNWIND $names AS name
+MERGE (e:Entity {name: name})
+"""
+
+
+def build_weighted_relationship_query(relationship_type: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    MATCH (a:Entity {{name: row.entity1}}), (b:Entity {{name: row.entity2}})
+    MERGE (a)-[r:`{relationship_type}`]->(b)
+    SET r.weight = row.weight
+    """
+
+
+RELATED_BATCH_QUERY = """
+UNWIND $rows AS row
+MERGE (a:Entity {name: row.source})
+MERGE (b:Entity {name: row.target})
+MERGE (a)-[r:RELATED {type: row.relationship}]->(b)
+"""
+
+
+def group_batch_queries(batch: Sequence[Sequence[str]], named: bool) -> list[tuple[str, list[dict]]]:
+    """
+    Groups a batch of rows into `(query, rows)` pairs, one pair per relationship type.
+
+    Named relationship types cannot be parameterized in Cypher, so each distinct type gets its
+    own UNWIND query. `RELATED` relationships keep the type as a property and share one query.
+    """
+    if not named:
+        return [(RELATED_BATCH_QUERY, [
+            {"source": source, "relationship": relationship, "target": target}
+            for source, relationship, target in batch
+        ])]
+
+    grouped: dict[str, list[dict]] = {}
+    for source, relationship, target in batch:
+        grouped.setdefault(sanitize_relationship_type(relationship), []).append(
+            {"source": source, "target": target})
+    return [(build_named_batch_query(relationship_type), rows) for relationship_type, rows in grouped.items()]
+
+
+ENTITY_LABEL = "Entity"
+ENTITY_NAME_CONSTRAINT_QUERY = (
+    "CREATE CONSTRAINT entity_name_unique IF NOT EXISTS FOR (e:Entity) REQUIRE e.name IS UNIQUE"
+)
+ENTITY_NAME_INDEX_QUERY = "CREATE INDEX entity_name IF NOT EXISTS FOR (e:Entity) ON (e.name)"
+
+
+def build_label_index_query(label: str) -> str:
+    index_name = re.sub(r"[^a-zA-Z0-9_]", "_", label).lower()
+    return f"CREATE INDEX {index_name}_name IF NOT EXISTS FOR (n:`{label}`) ON (n.name)"
+
+
+def _write_relationship_batch(tx, batch: Sequence[Sequence[str]], named: bool):
+    for query, rows in group_batch_queries(batch, named):
+        tx.run(query, {"rows": rows}).consume()
+
 
 @dataclass
 class Neo4jEngine:
     uri: str
     user: str
     password: str
-    driver: GraphDatabase.driver = field(init=False)
+    database: Optional[str] = None
+    max_connection_pool_size: int = DEFAULT_MAX_CONNECTION_POOL_SIZE
+    connection_acquisition_timeout: float = DEFAULT_CONNECTION_ACQUISITION_TIMEOUT
+    max_connection_lifetime: float = DEFAULT_MAX_CONNECTION_LIFETIME
+    fetch_size: int = DEFAULT_FETCH_SIZE
+    driver: Optional[Driver] = field(init=False, default=None)
+    bootstrap_schema: bool = True
+    _driver_key: Optional[tuple] = field(init=False, default=None, repr=False)
+    _schema_ready: bool = field(init=False, default=False, repr=False)
+    _indexed_labels: set = field(init=False, default_factory=set, repr=False)
 
     def __post_init__(self):
-        self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        self._driver_key, self.driver = acquire_shared_driver(
+            self.uri, self.user, self.password,
+            max_connection_pool_size=self.max_connection_pool_size,
+            connection_acquisition_timeout=self.connection_acquisition_timeout,
+            max_connection_lifetime=self.max_connection_lifetime,
+        )
 
     def __enter__(self):
-        self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.driver:
-            self.driver.close()
+        self.close()
 
     def close(self):
-        if self.driver:
-            self.driver.close()
+        if self._driver_key is not None:
+            release_shared_driver(self._driver_key)
+            self._driver_key = None
+            self.driver = None
 
-    def run(self, query, parameters=None):
-        with self.driver.session() as session:
-            return session.run(query, parameters or {})
+    def _session(self):
+        if self.bootstrap_schema and not self._schema_ready:
+            self.ensure_schema()
+        return self.driver.session(database=self.database, fetch_size=self.fetch_size)
 
+    def ensure_schema(self):
+        """
+        Idempotently creates the uniqueness constraint on `:Entity(name)` that every MERGE and MATCH in this
+        class looks nodes up by. Falls back to a plain index when existing duplicates prevent the constraint.
+        """
+        with self.driver.session(database=self.database) as session:
+            try:
+                session.run(ENTITY_NAME_CONSTRAINT_QUERY).consume()
+            except Exception as e:
+                print(f"Could not create uniqueness constraint on :Entity(name), using an index instead: {e}")
+                session.run(ENTITY_NAME_INDEX_QUERY).consume()
+        self._schema_ready = True
+        self._indexed_labels.add(ENTITY_LABEL)
+
+    def ensure_label_index(self, label: str):
+        """Idempotently creates a `name` index for a node label produced by `create_node`."""
+        if label in self._indexed_labels:
+            return
+        with self.driver.session(database=self.database) as session:
+            session.run(build_label_index_query(label)).consume()
+        self._indexed_labels.add(label)
+
+    def run(self, query, parameters=None) -> list[Record]:
+        """Runs a query and consumes every record before the session is closed."""
+        with self._session() as session:
+            return list(session.run(query, parameters or {}))
+
+    def stream(self, query, parameters=None) -> Iterator[Record]:
+        """
+        Runs a query and yields its records while the session stays open, fetching `fetch_size` records
+        at a time. The session is closed once the generator is exhausted or closed.
+        """
+        with self._session() as session:
+            yield from session.run(query, parameters or {})
+
+    @graph_write
     def create_node(self, node_type, properties):
+        # Every node also carries the :Entity label so that lookups by name go through its constraint.
+        if self.bootstrap_schema:
+            self.ensure_label_index(node_type)
         query = f"""
-        MERGE (n:{node_type} {{name: $name}})
+        MERGE (n:Entity {{name: $name}})
+        SET n:`{node_type}`
         SET n += $props
         RETURN n
         """
         self.run(query, {"name": properties["name"], "props": properties})
 
+    @graph_write
     def create_relationship(self, source, target, relationship):
         query = f"""
-        MATCH (a {{name: $source}}), (b {{name: $target}})
+        MATCH (a:Entity {{name: $source}}), (b:Entity {{name: $target}})
         MERGE (a)-[r:{relationship}]->(b)
         RETURN r
         """
         self.run(query, {"source": source, "target": target})
 
+    @graph_write
     def insert_into_neo4j(self, entities, relationships):
-        session = self.driver.session()
-        for entity in entities:
-            # Insert entity nodes into Neo4j
-            session.run("""
-            MERGE (e:Entity {name: $name})
-            """, name=entity)
+        """
+        Merges the entity nodes, then the weighted relationships between them, with one UNWIND query per
+        sanitized relationship type since Cypher cannot take a relationship type as a parameter.
 
+        :param entities: Entity names.
+        :param relationships: Dicts with `entity1`, `entity2`, `relationship_type` and optionally `weight`.
+        """
+        grouped: dict[str, list[dict]] = {}
         for relationship in relationships:
-            # Insert relationship into Neo4j
-            session.run("""
-            MATCH (a:Entity {name: $entity1}), (b:Entity {name: $entity2})
-            MERGE (a)-[:`$relationship_type`]->(b)
-            """, entity1=relationship['entity1'], entity2=relationship['entity2'],
-                        relationship_type=relationship['relationship_type'])
-        session.close()
-
+            grouped.setdefault(sanitize_relationship_type(relationship['relationship_type']), []).append({
+                "entity1": relationship['entity1'], "entity2": relationship['entity2'],
+                "weight": relationship.get('weight', 1),
+            })
+        with self._session() as session:
+            session.run(INSERT_ENTITIES_QUERY, {"names": list(entities)}).consume()
+            for relationship_type, rows in grouped.items():
+                session.run(build_weighted_relationship_query(relationship_type), {"rows": rows}).consume()
+
+    @graph_write
     def create_node_updated(self, name):
         query = """
         MERGE (n:Entity {name: $name})
         RETURN n
         """
-        with self.driver.session() as session:
+        with self._session() as session:
             session.run(query, {"name": name})
 
+    @graph_write
     def create_relationship_updated(self, source, target, relationship_type):
         query = """
         MATCH (a:Entity {name: $source}), (b:Entity {name: $target})
         MERGE (a)-[r:`RELATIONSHIP` {type: $relationship_type}]->(b)
         RETURN r
         """
-        with self.driver.session() as session:
+        with self._session() as session:
             session.run(query, {"source": source, "target": target, "relationship_type": relationship_type})
 
+    @graph_write
     def store_in_neo4j(self, relationships: list):
-        with self.driver.session() as session:
+        with self._session() as session:
             for rel in relationships:
                 try:
                     # Ensure the keys are correct before proceeding
@@ -101,8 +330,7 @@ class Neo4jEngine:
                     relationship = rel.get('relationship')
                     target = rel.get('target')
 
-                    # Debugging: Log the relationship being processed
-                    print(f"Processing relationship: {rel}")
+                    metrics.inc(ROWS_PROCESSED)
 
                     if source and relationship and target:
                         # Create or update source node
@@ -118,17 +346,54 @@ class Neo4jEngine:
                         RETURN r
                         """, {"source": source, "target": target, "relationship": relationship})
                     else:
-                        print(f"Skipping invalid relationship: {rel}")
+                        metrics.inc(ROWS_SKIPPED)
                 except Exception as e:
                     print(f"Error storing relationship {rel}: {e}")
 
-    def store_named_relationships_from_string(self, csv_content: str):
+    @graph_write
+    def store_relationships_batched(self, rows: Iterable[Sequence[str]], batch_size: int = DEFAULT_BATCH_SIZE,
+                                    named: bool = True) -> int:
+        """
+        Stores `(source, relationship, target)` rows in batches, one explicit write transaction per batch
+        and one UNWIND query per relationship type inside it.
+
+        :param rows: Any iterable of `(source, relationship, target)` rows, consumed lazily.
+        :param batch_size: Number of rows per transaction, up to `MAX_BATCH_SIZE`.
+        :param named: Store the relationship as its own sanitized type, otherwise as `RELATED {type: ...}`.
+        :return: The number of rows written.
+        """
+        validate_batch_size(batch_size)
+        total = 0
+        start = time.perf_counter()
+        with self._session() as session:
+            for batch in batched(rows, batch_size):
+                with metrics.timer(BATCH_WRITE_SECONDS):
+                    session.execute_write(_write_relationship_batch, batch, named)
+                total += len(batch)
+                metrics.inc(ROWS_WRITTEN, len(batch))
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else float(total)
+        metrics.set(ROWS_PER_SECOND, rate)
+        print(f"Stored {total} relationships in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+        return total
+
+    @graph_write
+    def store_named_relationships_from_string(self, csv_content: str, batch_size: Optional[int] = None):
         """
         Stores named relationships in Neo4j from a CSV string.
 
         :param csv_content: A string containing the CSV data with headers `source, relationship, target`.
+        :param batch_size: When set, writes the rows with `store_relationships_batched` instead of row by row.
         """
-        with self.driver.session() as session:
+        if batch_size:
+            try:
+                self.store_relationships_batched(read_relationship_rows(io.StringIO(csv_content)), batch_size)
+            except Exception as e:
+                print(f"Error processing CSV content: {e}")
+            return
+
+        with self._session() as session:
             try:
                 # Use StringIO to simulate a file object from the string
                 csv_file = io.StringIO(csv_content)
@@ -141,14 +406,13 @@ class Neo4jEngine:
 
                 for row in reader:
                     if len(row) != 3:  # Ensure each row has exactly 3 elements
-                        print(f"Skipping invalid row: {row}")
+                        metrics.inc(ROWS_SKIPPED)
                         continue
 
                     # Extract values from the row
                     source, relationship, target = row
 
-                    # Debugging: Log the relationship being processed
-                    print(f"Processing relationship: source={source}, relationship={relationship}, target={target}")
+                    metrics.inc(ROWS_PROCESSED)
 
                     if source and relationship and target:
                         # Create or update source node
@@ -165,17 +429,27 @@ class Neo4jEngine:
                         """
                         session.run(query, {"source": source, "target": target})
                     else:
-                        print(f"Skipping invalid relationship: {row}")
+                        metrics.inc(ROWS_SKIPPED)
             except Exception as e:
                 print(f"Error processing CSV content: {e}")
 
-    def store_named_relationships_from_file(self, csv_file_path: str):
+    @graph_write
+    def store_named_relationships_from_file(self, csv_file_path: str, batch_size: Optional[int] = None):
         """
         Stores named relationships in Neo4j from a CSV file.
 
         :param csv_file_path: Path to the CSV file containing relationships with headers `source, relationship, target`.
+        :param batch_size: When set, writes the rows with `store_relationships_batched` instead of row by row.
         """
-        with self.driver.session() as session:
+        if batch_size:
+            try:
+                with open(csv_file_path, mode='r', encoding='utf-8') as file:
+                    self.store_relationships_batched(read_relationship_rows(file), batch_size)
+            except Exception as e:
+                print(f"Error processing CSV file {csv_file_path}: {e}")
+            return
+
+        with self._session() as session:
             try:
                 with open(csv_file_path, mode='r', encoding='utf-8') as file:
                     reader = csv.reader(file)
@@ -187,7 +461,7 @@ class Neo4jEngine:
 
                     for row in reader:
                         if len(row) != 3:  # Ensure each row has exactly 3 elements
-                            print(f"Skipping invalid row: {row}")
+                            metrics.inc(ROWS_SKIPPED)
                             continue
 
                         # Extract values from the row
@@ -196,9 +470,7 @@ class Neo4jEngine:
                         # Sanitize the relationship type (replace invalid characters)
                         sanitized_relationship = re.sub(r"[^a-zA-Z0-9_]", "_", relationship).upper()
 
-                        # Debugging: Log the relationship being processed
-                        print(
-                            f"Processing relationship: source={source}, relationship={sanitized_relationship}, target={target}")
+                        metrics.inc(ROWS_PROCESSED)
 
                         if source and sanitized_relationship and target:
                             # Create or update source node
@@ -215,17 +487,27 @@ class Neo4jEngine:
                             """
                             session.run(query, {"source": source, "target": target})
                         else:
-                            print(f"Skipping invalid relationship: {row}")
+                            metrics.inc(ROWS_SKIPPED)
             except Exception as e:
                 print(f"Error processing CSV file {csv_file_path}: {e}")
 
-    def store_in_neo4j_csv(self, csv_file_path: str):
+    @graph_write
+    def store_in_neo4j_csv(self, csv_file_path: str, batch_size: Optional[int] = None):
         """
         Stores relationships in Neo4j from a CSV file.
 
         :param csv_file_path: Path to the CSV file containing relationships
+        :param batch_size: When set, writes the rows with `store_relationships_batched` instead of row by row.
         """
-        with self.driver.session() as session:
+        if batch_size:
+            try:
+                with open(csv_file_path, mode='r', encoding='utf-8') as file:
+                    self.store_relationships_batched(read_relationship_rows(file), batch_size, named=False)
+            except Exception as e:
+                print(f"Error reading or processing CSV file {csv_file_path}: {e}")
+            return
+
+        with self._session() as session:
             try:
                 with open(csv_file_path, mode='r', encoding='utf-8') as file:
                     reader = csv.DictReader(file)  # Read CSV with headers as dictionary
@@ -235,8 +517,7 @@ class Neo4jEngine:
                         relationship = rel.get('relationship')
                         target = rel.get('target')
 
-                        # Debugging: Log the relationship being processed
-                        print(f"Processing relationship: {rel}")
+                        metrics.inc(ROWS_PROCESSED)
 
                         if source and relationship and target:
                             # Create or update source node
@@ -252,6 +533,6 @@ class Neo4jEngine:
                             RETURN r
                             """, {"source": source, "target": target, "relationship": relationship})
                         else:
-                            print(f"Skipping invalid relationship: {rel}")
+                            metrics.inc(ROWS_SKIPPED)
             except Exception as e:
                 print(f"Error reading or processing CSV file {csv_file_path}: {e}")
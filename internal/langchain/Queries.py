@@ -1,16 +1,84 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Callable, Iterable, Optional, Union
 
 from langchain_community.graphs import Neo4jGraph
 from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars, Neo4jVector
 from langchain_core.runnables import RunnableSerializable
 
+from db.memory.memory_graph import InMemoryGraphEngine
+from internal.langchain.retrieval_cache import RetrievalCache
+from internal.langchain.vector_index import NumpyVectorIndex
+from internal.metrics.metrics import metrics
+
+metrics.describe("retriever_seconds", "Latency of retrieval stages, by stage.")
+metrics.describe("retriever_degraded_total", "Retrievals answered without a branch, by branch and reason.")
+
+# Seconds each retrieval branch may take before the context is built without it
+STRUCTURED_TIMEOUT = float(os.getenv("RETRIEVER_STRUCTURED_TIMEOUT", 5.0))
+VECTOR_TIMEOUT = float(os.getenv("RETRIEVER_VECTOR_TIMEOUT", 3.0))
+
+# Threads shared by every Queries instance. A branch that timed out keeps its thread and slot until it
+# returns; once every slot is taken, new branches are skipped instead of queueing behind the stuck ones.
+RETRIEVER_WORKERS = int(os.getenv("RETRIEVER_WORKERS", 16))
+_retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVER_WORKERS, thread_name_prefix="retriever")
+_retrieval_slots = threading.BoundedSemaphore(RETRIEVER_WORKERS)
+
+# Fulltext matches per entity, neighborhood lines per entity and lines in the whole structured context
+ENTITY_MATCH_LIMIT = 2
+ENTITY_OUTPUT_LIMIT = 50
+TOTAL_OUTPUT_LIMIT = 200
+
+# One round trip for every entity in the question, instead of one query per entity. Rows are ordered,
+# deduplicated and cut to the total limit in Python: DISTINCT does not keep the order of an ORDER BY.
+BATCHED_NEIGHBORHOOD_QUERY = """
+UNWIND range(0, size($queries) - 1) AS position
+CALL {
+  WITH position
+  CALL db.index.fulltext.queryNodes('entity', $queries[position], {limit: $match_limit})
+  YIELD node
+  CALL {
+    WITH node
+    MATCH (node)-[r:!MENTIONS]->(neighbor)
+    RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
+    UNION ALL
+    WITH node
+    MATCH (node)<-[r:!MENTIONS]-(neighbor)
+    RETURN neighbor.id + ' - ' + type(r) + ' -> ' +  node.id AS output
+  }
+  RETURN output LIMIT $entity_limit
+}
+RETURN position, output
+"""
+
+
+def merge_outputs(outputs: Iterable[str], total_limit: int = TOTAL_OUTPUT_LIMIT) -> str:
+    """Joins neighborhood lines in order, dropping lines already reported for another entity."""
+    lines = {}
+    for output in outputs:
+        lines.setdefault(output)
+        if len(lines) >= total_limit:
+            break
+    return "\n".join(lines)
+
 
 @dataclass
 class Queries:
     entity_chain: RunnableSerializable[dict, Any]
-    vector_index: Neo4jVector
-    graph: Neo4jGraph
+    vector_index: Union[Neo4jVector, NumpyVectorIndex]
+    graph: Union[Neo4jGraph, InMemoryGraphEngine]
+    # Send every entity of a question in one query; False keeps the one-query-per-entity path
+    batch_entities: bool = True
+    total_output_limit: int = TOTAL_OUTPUT_LIMIT
+    # Reuses the context of recently asked questions, see `RetrievalCache`
+    cache: Optional[RetrievalCache] = None
+    # Run the structured and vector branches concurrently, each within its own timeout
+    parallel: bool = True
+    structured_timeout: Optional[float] = STRUCTURED_TIMEOUT
+    vector_timeout: Optional[float] = VECTOR_TIMEOUT
 
     @staticmethod
     def generate_full_text_query(input_string: str) -> str:
@@ -37,8 +105,16 @@ class Queries:
         in the question
         """
         result = ""
-        entities = self.entity_chain.invoke({"question": question})
+        with metrics.timer("retriever_seconds", stage="entities"):
+            entities = self.entity_chain.invoke({"question": question})
+        if self.batch_entities:
+            with metrics.timer("retriever_seconds", stage="graph"):
+                return self.batched_neighborhood(entities.names)
+        graph_start = time.perf_counter()
         for entity in entities.names:
+            if isinstance(self.graph, InMemoryGraphEngine):
+                result += "\n".join(self.graph.fulltext_neighborhood(entity, limit=2, output_limit=50))
+                continue
             response = self.graph.query(
                 """CALL db.index.fulltext.queryNodes('entity', $query, {limit:2})
                 YIELD node,score
@@ -56,15 +132,107 @@ class Queries:
                 {"query": self.generate_full_text_query(entity)},
             )
             result += "\n".join([el['output'] for el in response])
+        metrics.observe("retriever_seconds", time.perf_counter() - graph_start, stage="graph")
         return result
 
+    def batched_neighborhood(self, names: list[str]) -> str:
+        """
+        Collects the neighborhoods of all `names` with a single graph query. Lines are kept in the
+        order of the names, a line shared by two entities is reported once, and at most
+        `ENTITY_OUTPUT_LIMIT` lines per entity and `total_output_limit` lines overall are returned.
+        """
+        # Names made only of Lucene operators would produce an empty fulltext query
+        names = [name for name in dict.fromkeys(names) if remove_lucene_chars(name).split()]
+        if not names:
+            return ""
+        if isinstance(self.graph, InMemoryGraphEngine):
+            return merge_outputs(self.graph.batched_fulltext_neighborhood(
+                names, ENTITY_MATCH_LIMIT, ENTITY_OUTPUT_LIMIT), self.total_output_limit)
+
+        response = self.graph.query(BATCHED_NEIGHBORHOOD_QUERY, {
+            "queries": [self.generate_full_text_query(name) for name in names],
+            "match_limit": ENTITY_MATCH_LIMIT,
+            "entity_limit": ENTITY_OUTPUT_LIMIT,
+        })
+        # sorted is stable, so each entity's lines keep the order the query returned them in
+        response = sorted(response, key=lambda el: el['position'])
+        return merge_outputs((el['output'] for el in response), self.total_output_limit)
+
     def retriever(self, question: str):
         print(f"Search query: {question}")
-        structured_data = self.structured_retriever(question)
-        unstructured_data = [el.page_content for el in self.vector_index.similarity_search(question)]
+        if self.cache is None:
+            return self._retrieve(question)[0]
+
+        context = self.cache.get(question)
+        if context is None:
+            generation = self.cache.generation
+            context, complete = self._retrieve(question)
+            # A context that is missing a branch is not reused for later turns
+            if complete:
+                self.cache.put(question, context, generation)
+        return context
+
+    def vector_retriever(self, question: str) -> list[str]:
+        with metrics.timer("retriever_seconds", stage="vector"):
+            return [el.page_content for el in self.vector_index.similarity_search(question)]
+
+    def _retrieve(self, question: str) -> tuple[str, bool]:
+        """Returns the retrieval context and whether both branches contributed to it."""
+        with metrics.timer("retriever_seconds", stage="total"):
+            if self.parallel:
+                structured = self._submit_branch(self.structured_retriever, question, "structured")
+                unstructured = self._submit_branch(self.vector_retriever, question, "vector")
+                started = time.monotonic()
+                structured_data = self._branch_result(structured, "structured", started, self.structured_timeout)
+                unstructured_data = self._branch_result(unstructured, "vector", started, self.vector_timeout)
+            else:
+                structured_data = self.structured_retriever(question)
+                unstructured_data = self.vector_retriever(question)
+        complete = structured_data is not None and unstructured_data is not None
+        structured_data = structured_data or ""
+        unstructured_data = unstructured_data or []
         final_data = f"""Structured data:
     {structured_data}
     Unstructured data:
     {"#Document ".join(unstructured_data)}
         """
-        return final_data
+        return final_data, complete
+
+    @staticmethod
+    def _submit_branch(retrieve: Callable[[str], Any], question: str, branch: str) -> Optional[Future]:
+        """Starts a branch on the shared pool, or returns None right away when every slot is taken."""
+        if not _retrieval_slots.acquire(blocking=False):
+            metrics.inc("retriever_degraded_total", branch=branch, reason="saturated")
+            print(f"All {RETRIEVER_WORKERS} retriever threads are busy, answering without {branch} retrieval")
+            return None
+
+        def run():
+            try:
+                return retrieve(question)
+            finally:
+                _retrieval_slots.release()
+
+        try:
+            return _retrieval_executor.submit(run)
+        except BaseException:
+            _retrieval_slots.release()
+            raise
+
+    @staticmethod
+    def _branch_result(future: Optional[Future], branch: str, started: float, timeout: Optional[float]):
+        """
+        Waits for a branch until `timeout` seconds after `started`, returning None when it is late,
+        failed or was never started, so that the answer can still be built from the other branch.
+        """
+        if future is None:
+            return None
+        remaining = None if timeout is None else max(0.0, started + timeout - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except TimeoutError:
+            metrics.inc("retriever_degraded_total", branch=branch, reason="timeout")
+            print(f"{branch.capitalize()} retrieval took longer than {timeout}s, answering without it")
+        except Exception as e:
+            metrics.inc("retriever_degraded_total", branch=branch, reason="error")
+            print(f"{branch.capitalize()} retrieval failed, answering without it: {e}")
+        return None
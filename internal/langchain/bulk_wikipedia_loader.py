@@ -0,0 +1,203 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+import wikipedia
+from langchain.docstore.document import Document
+
+from internal.langchain.token_chunker import TokenChunker
+from internal.langchain.wikipedia_api import iter_document_chunks
+from internal.metrics.metrics import metrics
+
+metrics.describe("wikipedia_page_cache_total", "Wikipedia page lookups, by whether the page cache answered them.")
+
+DEFAULT_PAGE_CACHE_DIR = os.getenv("WIKIPEDIA_CACHE_DIR", ".wikipedia_cache")
+DEFAULT_PAGE_TITLES = ["Marcus Aurelius"]
+# What is ingested for each title: "summary" matches `WikipediaDocumentLoader`, the summaries of the top
+# search results capped in length, while "full" takes the whole article, which is many times larger
+CONTENT_MODES = ("summary", "full")
+SUMMARY_RESULTS = 3
+SUMMARY_MAX_CHARS = 4000
+
+
+@dataclass
+class RawPageCache:
+    """Gzip-compressed JSON copies of raw Wikipedia pages, stored as `<directory>/<title>/<revision>.json.gz`."""
+    directory: str = DEFAULT_PAGE_CACHE_DIR
+
+    def _page_directory(self, title: str) -> str:
+        # Readable prefix plus a hash, since different titles can sanitize to the same prefix
+        readable = re.sub(r"[^\w-]+", "_", title).strip("_")[:80]
+        digest = hashlib.sha1(title.encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.directory, f"{readable}-{digest}")
+
+    def revisions(self, title: str) -> list[int]:
+        page_directory = self._page_directory(title)
+        if not os.path.isdir(page_directory):
+            return []
+        return sorted(int(name.split(".")[0]) for name in os.listdir(page_directory) if name.endswith(".json.gz"))
+
+    def get(self, title: str, revision_id: Optional[int] = None) -> Optional[dict]:
+        """Returns the cached page at `revision_id`, or its latest cached revision when none is given."""
+        if revision_id is None:
+            revisions = self.revisions(title)
+            if not revisions:
+                return None
+            revision_id = revisions[-1]
+        path = os.path.join(self._page_directory(title), f"{revision_id}.json.gz")
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            return json.load(file)
+
+    def put(self, page: dict):
+        page_directory = self._page_directory(page["title"])
+        os.makedirs(page_directory, exist_ok=True)
+        path = os.path.join(page_directory, f"{page['revision_id']}.json.gz")
+        temporary_path = f"{path}.tmp"
+        with gzip.open(temporary_path, 'wt', encoding='utf-8') as file:
+            json.dump(page, file)
+        os.replace(temporary_path, path)
+
+
+@dataclass
+class BulkWikipediaLoader:
+    """
+    Loads many Wikipedia pages at once on a bounded thread pool, keeping every fetched revision in a
+    local `RawPageCache`.
+
+    The cache does not save downloads by default: with `refresh` set, every page is downloaded again
+    and only a new revision is added to the cache. It serves offline replay, and runs with `refresh`
+    unset, which download only the pages missing from it and may ingest outdated revisions.
+
+    :param content: "summary" (the default) ingests the summaries of the top `SUMMARY_RESULTS` search
+        results for each title, at most `SUMMARY_MAX_CHARS` characters, like `WikipediaDocumentLoader`.
+        "full" ingests the whole article, which sends many more chunks to the LLM.
+    :param offline: Never touch the network and replay the latest cached revision of every page.
+    :param refresh: Download pages that are already cached to pick up new revisions.
+    :param cache: Defaults to a separate cache directory per content mode.
+    """
+    page_titles: List[str]
+    max_workers: int = 8
+    content: str = "summary"
+    offline: bool = field(default_factory=lambda: os.getenv("WIKIPEDIA_OFFLINE") == "1")
+    refresh: bool = True
+    cache: Optional[RawPageCache] = None
+    chunker: TokenChunker = field(default_factory=lambda: TokenChunker(chunk_size=512, chunk_overlap=128))
+
+    def __post_init__(self):
+        if self.content not in CONTENT_MODES:
+            raise ValueError(f"content must be one of {CONTENT_MODES}, got {self.content!r}.")
+        if self.cache is None:
+            self.cache = RawPageCache(os.path.join(DEFAULT_PAGE_CACHE_DIR, self.content))
+
+
+    @classmethod
+    def from_file(cls, titles_path: str, **kwargs) -> "BulkWikipediaLoader":
+        """Reads one page title per line, ignoring blank lines and lines starting with `#`."""
+        with open(titles_path, 'r', encoding='utf-8') as file:
+            titles = [line.strip() for line in file if line.strip() and not line.startswith("#")]
+        return cls(titles, **kwargs)
+
+    def fetch_page(self, title: str) -> dict:
+        if self.offline or not self.refresh:
+            cached = self.cache.get(title)
+            if cached is not None:
+                metrics.inc("wikipedia_page_cache_total", result="hit")
+                return cached
+            if self.offline:
+                raise LookupError(f"Page {title!r} is not in the page cache at {self.cache.directory}.")
+
+        metrics.inc("wikipedia_page_cache_total", result="miss")
+        with metrics.timer("wikipedia_fetch_seconds"):
+            raw_page = self._download_full(title) if self.content == "full" else self._download_summary(title)
+        self.cache.put(raw_page)
+        return raw_page
+
+    @staticmethod
+    def _download_full(title: str) -> dict:
+        page = wikipedia.page(title, auto_suggest=False)
+        return {"title": title, "revision_id": int(page.revision_id), "url": page.url, "content": page.content}
+
+    @staticmethod
+    def _download_summary(title: str) -> dict:
+        """Same text as `WikipediaAPIWrapper.run`: one `Page:`/`Summary:` block per top search result."""
+        pages = []
+        for result in wikipedia.search(title, results=SUMMARY_RESULTS):
+            try:
+                pages.append(wikipedia.page(result, auto_suggest=False))
+            except (wikipedia.PageError, wikipedia.DisambiguationError):
+                continue
+        if not pages:
+            raise LookupError(f"No Wikipedia page found for {title!r}.")
+        content = "\n\n".join(f"Page: {page.title}\nSummary: {page.summary}" for page in pages)
+        return {
+            "title": title,
+            # Revision ids grow across all of Wikipedia, so a new revision of any result raises the maximum
+            "revision_id": max(int(page.revision_id) for page in pages),
+            "url": pages[0].url,
+            "content": content[:SUMMARY_MAX_CHARS],
+        }
+
+    def lazy_load(self) -> Iterator[Document]:
+        """
+        Yields one Document per page in title order; pages that fail to load are reported and skipped.
+
+        At most `max_workers` pages are fetched ahead of the consumer: the next title is only submitted
+        once a page has been taken, so a consumer that stops reading also stops the downloads.
+        """
+        titles = iter(self.page_titles)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = deque((title, executor.submit(self.fetch_page, title))
+                            for title in islice(titles, self.max_workers))
+            while futures:
+                title, future = futures.popleft()
+                next_title = next(titles, None)
+                if next_title is not None:
+                    futures.append((next_title, executor.submit(self.fetch_page, next_title)))
+                try:
+                    page = future.result()
+                except Exception as e:
+                    print(f"Error loading Wikipedia page {title}: {e}")
+                    continue
+                yield Document(page_content=page["content"], metadata={
+                    "source": title, "revision_id": page["revision_id"], "url": page["url"]})
+
+    def load(self) -> List[Document]:
+        return list(self.lazy_load())
+
+    def split_document(self, raw_documents: List[Document]) -> List[Document]:
+        return list(self.iter_chunks(raw_documents))
+
+    def iter_chunks(self, raw_documents: Iterable[Document]) -> Iterator[Document]:
+        # Same chunking and chunk hashes as the single page loader
+        return iter_document_chunks(self.chunker, raw_documents)
+
+
+def add_page_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--pages", nargs="+", default=None, help="Wikipedia page titles to ingest.")
+    parser.add_argument("--pages-file", default=None, help="File with one Wikipedia page title per line.")
+    parser.add_argument("--offline", action="store_true", help="Only use pages from the local page cache.")
+    parser.add_argument("--cached", action="store_true",
+                        help="Use cached pages as they are and only download pages missing from the cache.")
+    parser.add_argument("--full-articles", action="store_true",
+                        help="Ingest whole articles instead of the summaries of the top search results.")
+
+
+def loader_from_arguments(args: argparse.Namespace) -> BulkWikipediaLoader:
+    options = {
+        "offline": args.offline or os.getenv("WIKIPEDIA_OFFLINE") == "1",
+        "refresh": not args.cached,
+        "content": "full" if args.full_articles else "summary",
+    }
+    if args.pages_file:
+        return BulkWikipediaLoader.from_file(args.pages_file, **options)
+    return BulkWikipediaLoader(args.pages or DEFAULT_PAGE_TITLES, **options)
@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from langchain.docstore.document import Document
+
+DEFAULT_MANIFEST_PATH = os.getenv("CHUNK_MANIFEST_PATH", ".chunk_manifest.json")
+CONTENT_HASH_KEY = "content_hash"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ChunkManifest:
+    """
+    Local record of the chunks that have already gone through extraction and into the graph, keyed by
+    the `content_hash` metadata that `WikipediaDocumentLoader.split_document` attaches to every chunk.
+    """
+    path: str = DEFAULT_MANIFEST_PATH
+    _sources: dict[str, str] = field(init=False, default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self._sources = json.load(file)
+
+    def __contains__(self, chunk_hash: str) -> bool:
+        return chunk_hash in self._sources
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def filter_new(self, chunks: Iterable[Document]) -> list[Document]:
+        """Returns the chunks whose content has not been processed yet."""
+        return [chunk for chunk in chunks if self._hash_of(chunk) not in self._sources]
+
+    def iter_new(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """Lazy version of `filter_new`."""
+        return (chunk for chunk in chunks if self._hash_of(chunk) not in self._sources)
+
+    def mark_processed(self, chunks: Iterable[Document]):
+        for chunk in chunks:
+            self._sources[self._hash_of(chunk)] = chunk.metadata.get("source", "")
+        self.save()
+
+    def save(self):
+        # Write to a temporary file first so that an interrupted run never leaves a truncated manifest
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(self._sources, file, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+    @staticmethod
+    def _hash_of(chunk: Document) -> str:
+        return chunk.metadata.get(CONTENT_HASH_KEY) or content_hash(chunk.page_content)
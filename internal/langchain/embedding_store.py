@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+from langchain_community.graphs import Neo4jGraph
+from langchain_core.embeddings import Embeddings
+
+from internal.langchain.chunk_manifest import content_hash
+from internal.metrics.metrics import metrics
+
+DEFAULT_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", ".embedding_store")
+DEFAULT_EMBEDDING_BATCH_SIZE = 512
+DEFAULT_SYNC_PAGE_SIZE = 2_000
+DEFAULT_QUERY_CACHE_SIZE = 1024
+_INITIAL_CAPACITY = 1024
+_DIGEST_SIZE = hashlib.sha256().digest_size
+
+metrics.describe("embedding_cache_total", "Texts looked up in the embedding store, by result.")
+metrics.describe("embedding_batch_seconds", "Duration of one batch of embedding requests.")
+
+# Same shape as the text that `Neo4jVector.from_existing_graph` embeds, so either path gives the same vectors
+DOCUMENT_TEXT = "reduce(str = '', k IN $props | str + '\\n' + k + ':' + coalesce(n[k], ''))"
+# `text_hash` is the hash of the text the current embedding was computed from, written together with the
+# embedding. A node without it is new, or had its text changed by a writer that removed it, so startup
+# only checks two properties instead of hashing every node's text.
+PENDING_DOCUMENTS_QUERY = """
+MATCH (n:`{label}`)
+WHERE (n.`{embedding}` IS NULL OR n.text_hash IS NULL) AND any(k IN $props WHERE n[k] IS NOT NULL)
+RETURN elementId(n) AS id, %s AS text
+LIMIT $limit
+""" % DOCUMENT_TEXT
+DOCUMENTS_CHANGED_QUERY = """
+MATCH (n:`{label}`) WHERE n.id IN $ids
+REMOVE n.text_hash
+"""
+SET_EMBEDDINGS_QUERY = """
+UNWIND $rows AS row
+MATCH (n) WHERE elementId(n) = row.id
+SET n.`{embedding}` = row.embedding, n.text_hash = row.hash
+"""
+
+
+@dataclass
+class EmbeddingStore:
+    """
+    Append-only store of embeddings keyed by content hash, kept in a directory with three files:
+
+    - `vectors.f32`: a float32 matrix, memory mapped and grown by doubling
+    - `ids.bin`: the 32-byte sha256 key of each matrix row, in row order
+    - `meta.json`: the dimensions of the vectors
+
+    A row only counts once its key is appended to `ids.bin`, which happens after the vector is
+    written, so an interrupted run loses at most the rows it was adding.
+    """
+    path: str = DEFAULT_STORE_PATH
+    dimensions: Optional[int] = None
+    _rows: dict[bytes, int] = field(init=False, default_factory=dict, repr=False)
+    _vectors: Optional[np.memmap] = field(init=False, default=None, repr=False)
+    _capacity: int = field(init=False, default=0, repr=False)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r', encoding='utf-8') as file:
+                stored_dimensions = json.load(file)["dimensions"]
+            if self.dimensions not in (None, stored_dimensions):
+                raise ValueError(f"{self.path} holds {stored_dimensions}-dimensional vectors, "
+                                 f"not {self.dimensions}-dimensional ones.")
+            self.dimensions = stored_dimensions
+        if os.path.exists(self._ids_path):
+            with open(self._ids_path, 'rb') as file:
+                ids = file.read()
+            # A key cut short by an interrupted append is ignored
+            count = len(ids) // _DIGEST_SIZE
+            self._rows = {ids[row * _DIGEST_SIZE:(row + 1) * _DIGEST_SIZE]: row for row in range(count)}
+        if self.dimensions and os.path.exists(self._vectors_path):
+            self._map(os.path.getsize(self._vectors_path) // (4 * self.dimensions))
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def _ids_path(self) -> str:
+        return os.path.join(self.path, "ids.bin")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._rows
+
+    @staticmethod
+    def key(text: str, namespace: str = "") -> bytes:
+        """Content hash of `text`; the namespace keeps vectors of different models apart."""
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).digest()
+
+    def _map(self, capacity: int):
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self._vectors_path, 'ab') as file:
+            file.truncate(capacity * 4 * self.dimensions)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+',
+                                  shape=(capacity, self.dimensions)) if capacity else None
+        self._capacity = capacity
+
+    def rows(self, keys: Sequence[bytes]) -> list[Optional[int]]:
+        """Matrix row of each key, or None for keys that are not stored."""
+        return [self._rows.get(key) for key in keys]
+
+    def get(self, keys: Sequence[bytes]) -> list[Optional[np.ndarray]]:
+        """Returns a copy of the stored vector for each key, or None for keys that are not stored."""
+        rows = self.rows(keys)
+        return [None if row is None else np.array(self._vectors[row]) for row in rows]
+
+    def put(self, keys: Sequence[bytes], vectors: Sequence[Sequence[float]]):
+        with self._lock:
+            # The same text may appear twice in one call, each key gets a single row
+            new = list({key: vector for key, vector in zip(keys, vectors) if key not in self._rows}.items())
+            if not new:
+                return
+            if self.dimensions is None:
+                self.dimensions = len(new[0][1])
+                with open(self._meta_path, 'w', encoding='utf-8') as file:
+                    json.dump({"dimensions": self.dimensions}, file)
+
+            start = len(self._rows)
+            end = start + len(new)
+            if end > self._capacity:
+                self._map(max(end, 2 * self._capacity, _INITIAL_CAPACITY))
+            self._vectors[start:end] = np.asarray([vector for _, vector in new], dtype=np.float32)
+            self._vectors.flush()
+            with open(self._ids_path, 'ab') as file:
+                file.write(b"".join(key for key, _ in new))
+            for row, (key, _) in enumerate(new, start):
+                self._rows[key] = row
+
+    def matrix(self) -> np.ndarray:
+        """A read-only view of every stored vector, in insertion order, without copying."""
+        if self._vectors is None:
+            return np.empty((0, self.dimensions or 0), dtype=np.float32)
+        view = self._vectors[:len(self._rows)].view(np.ndarray)
+        view.flags.writeable = False
+        return view
+
+
+@dataclass
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a langchain embedding model so that each distinct text is embedded once across runs. Texts
+    missing from the store are embedded `batch_size` at a time.
+    """
+    embeddings: Embeddings
+    store: EmbeddingStore = field(default_factory=EmbeddingStore)
+    batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE
+    namespace: Optional[str] = None
+    query_cache_size: int = DEFAULT_QUERY_CACHE_SIZE
+    _query_vectors: OrderedDict = field(init=False, default_factory=OrderedDict, repr=False)
+    _query_lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        if self.namespace is None:
+            self.namespace = f"{type(self.embeddings).__name__}:{getattr(self.embeddings, 'model', '')}"
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self.store.key(text, self.namespace) for text in texts]
+        vectors = self.store.get(keys)
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        metrics.inc("embedding_cache_total", len(texts) - len(missing), result="hit")
+        metrics.inc("embedding_cache_total", len(missing), result="miss")
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            with metrics.timer("embedding_batch_seconds"):
+                embedded = self.embeddings.embed_documents([texts[index] for index in batch])
+            self.store.put([keys[index] for index in batch], embedded)
+            for index, vector in zip(batch, embedded):
+                vectors[index] = vector
+        return [[float(value) for value in vector] for vector in vectors]
+
+    def embed_query(self, text: str) -> list[float]:
+        # Chat traffic repeats itself, but every question is new text, so query vectors are kept in a
+        # bounded in-memory LRU rather than in the append-only store
+        with self._query_lock:
+            vector = self._query_vectors.get(text)
+            if vector is not None:
+                self._query_vectors.move_to_end(text)
+        if vector is not None:
+            metrics.inc("embedding_cache_total", result="query_hit")
+            return list(vector)
+
+        metrics.inc("embedding_cache_total", result="query_miss")
+        vector = [float(value) for value in self.embeddings.embed_query(text)]
+        with self._query_lock:
+            self._query_vectors[text] = vector
+            while len(self._query_vectors) > self.query_cache_size:
+                self._query_vectors.popitem(last=False)
+        return list(vector)
+
+
+def mark_documents_changed(graph: Neo4jGraph, ids: Sequence[str], node_label: str = "Document"):
+    """Queues the `node_label` nodes with the given `id`s for re-embedding; call after changing their text in place."""
+    graph.query(DOCUMENTS_CHANGED_QUERY.format(label=node_label), {"ids": list(ids)})
+
+
+def _pending_documents(graph: Neo4jGraph, label: str, props: list[str], embedding: str,
+                       page_size: int) -> Iterator[list[dict]]:
+    """Yields pages of `{id, text}` for nodes without an embedding or whose text changed since."""
+    query = PENDING_DOCUMENTS_QUERY.format(label=label, embedding=embedding)
+    seen = set()
+    # Each page is embedded before the next query, which then no longer returns those nodes
+    while rows := graph.query(query, {"props": props, "limit": page_size}):
+        if all(row["id"] in seen for row in rows):
+            # Writing the page did not take its nodes out of the query, so asking again would loop forever
+            print(f"{len(rows)} {label} nodes are still pending after being embedded, stopping the sync.")
+            return
+        seen.update(row["id"] for row in rows)
+        yield rows
+
+
+def sync_document_embeddings(graph: Neo4jGraph, embeddings: CachedEmbeddings, node_label: str = "Document",
+                             text_node_properties: Sequence[str] = ("text",),
+                             embedding_node_property: str = "embedding",
+                             page_size: int = DEFAULT_SYNC_PAGE_SIZE) -> int:
+    """
+    Embeds the `node_label` nodes that have no embedding yet or no `text_hash`, `page_size` at a
+    time, taking every vector the store already has instead of requesting it again. Each embedded
+    node records the `text_hash` it was embedded from; code that changes the text of an existing
+    node must remove it, see `mark_documents_changed`. Run before `Neo4jVector.from_existing_graph`,
+    which then finds nothing left to embed.
+
+    :return: The number of nodes that were given a new embedding.
+    """
+    set_query = SET_EMBEDDINGS_QUERY.format(embedding=embedding_node_property)
+    total = 0
+    for rows in _pending_documents(graph, node_label, list(text_node_properties), embedding_node_property,
+                                   page_size):
+        texts = [row["text"] for row in rows]
+        vectors = embeddings.embed_documents(texts)
+        graph.query(set_query, {"rows": [
+            {"id": row["id"], "embedding": vector, "hash": content_hash(text)}
+            for row, text, vector in zip(rows, texts, vectors)
+        ]})
+        total += len(rows)
+    print(f"Embedded {total} {node_label} nodes, {len(embeddings.store)} vectors in {embeddings.store.path}")
+    return total
@@ -0,0 +1,179 @@
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+from langchain_community.graphs import Neo4jGraph
+from langchain_core.runnables import RunnableLambda, RunnableSerializable
+
+from db.events import on_graph_changed
+from db.memory.memory_graph import InMemoryGraphEngine
+from internal.llm.Entities import Entities
+from internal.metrics.metrics import metrics
+
+ENTITY_IDS_QUERY = "MATCH (e:__Entity__) WHERE e.id IS NOT NULL RETURN e.id AS id"
+# Shorter names ("Or", "He") mostly match ordinary words in questions
+DEFAULT_MIN_LENGTH = 3
+# New names go into a small second automaton until it reaches this share of the main one
+DELTA_REBUILD_RATIO = 0.1
+MIN_DELTA_REBUILD_SIZE = 1024
+
+metrics.describe("entity_recognizer_total", "Questions whose entities were found, by recognizer.")
+
+
+def normalize_name(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class _Automaton:
+    """Aho-Corasick automaton over normalized names, matching all of them in one pass over a text."""
+
+    def __init__(self, names: dict[str, str]):
+        self.size = len(names)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # (length of the match, canonical name) for every name ending at a node, including via fail links
+        self._outputs: list[list[tuple[int, str]]] = [[]]
+        for key, canonical in names.items():
+            node = 0
+            for char in key:
+                child = self._goto[node].get(char)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][char] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                node = child
+            self._outputs[node].append((len(key), canonical))
+        self._link()
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int, str]]:
+        """Yields `(start, end, canonical name)` for every occurrence of every name in `text`."""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, canonical in outputs[node]:
+                yield end - length, end, canonical
+
+
+def entity_ids_loader(graph: Union[Neo4jGraph, InMemoryGraphEngine]) -> Callable[[], Iterable[str]]:
+    """Returns a function that lists the ids of every `__Entity__` node, or every node name in memory."""
+    if isinstance(graph, InMemoryGraphEngine):
+        return graph.node_names
+    return lambda: [row["id"] for row in graph.query(ENTITY_IDS_QUERY)]
+
+
+@dataclass
+class Gazetteer:
+    """
+    Finds the graph entities mentioned in a question by exact, case-insensitive, whole-word matching of
+    every entity id at once.
+
+    The ids are loaded on first use. Graph writes made by this process mark the gazetteer as stale,
+    and the next lookup loads the ids again but only adds the new ones: they go into a small delta
+    automaton, which is merged into the main one once it grows past `DELTA_REBUILD_RATIO` of its size.
+    """
+    load_names: Callable[[], Iterable[str]]
+    min_length: int = DEFAULT_MIN_LENGTH
+    _names: dict[str, str] = field(init=False, default_factory=dict, repr=False)
+    _main: _Automaton = field(init=False, default_factory=lambda: _Automaton({}), repr=False)
+    _delta: _Automaton = field(init=False, default_factory=lambda: _Automaton({}), repr=False)
+    _delta_names: dict[str, str] = field(init=False, default_factory=dict, repr=False)
+    _stale: bool = field(init=False, default=True, repr=False)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        on_graph_changed(self.mark_stale)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def mark_stale(self):
+        self._stale = True
+
+    def add(self, names: Iterable[str]) -> int:
+        """Adds names to the gazetteer and returns how many of them were new."""
+        with self._lock:
+            return self._add(names)
+
+    def _add(self, names: Iterable[str]) -> int:
+        new_names = {}
+        for name in names:
+            if not isinstance(name, str):
+                continue
+            key = normalize_name(name)
+            if len(key) >= self.min_length and key not in self._names and key not in new_names:
+                new_names[key] = name
+        if not new_names:
+            return 0
+
+        self._names.update(new_names)
+        self._delta_names.update(new_names)
+        if len(self._delta_names) > max(MIN_DELTA_REBUILD_SIZE, DELTA_REBUILD_RATIO * self._main.size):
+            self._main = _Automaton(self._names)
+            self._delta_names = {}
+        self._delta = _Automaton(self._delta_names)
+        return len(new_names)
+
+    def refresh(self) -> int:
+        with self._lock:
+            # Cleared first, so that a write during the load marks the gazetteer stale again
+            self._stale = False
+            return self._add(self.load_names())
+
+    def match(self, question: str) -> list[str]:
+        """
+        Returns the entity ids mentioned in `question` in order of appearance. Where names overlap, the
+        longest one wins, so "Marcus Aurelius" is preferred to "Aurelius".
+        """
+        if self._stale:
+            self.refresh()
+        text = normalize_name(question)
+        main, delta = self._main, self._delta
+        candidates = sorted(
+            (match for automaton in (main, delta) for match in automaton.iter_matches(text)
+             if self._is_word(text, match[0], match[1])),
+            key=lambda match: (match[0], match[0] - match[1]))
+
+        names, covered_until = [], 0
+        for start, end, canonical in candidates:
+            if start >= covered_until:
+                names.append(canonical)
+                covered_until = end
+        return list(dict.fromkeys(names))
+
+    @staticmethod
+    def _is_word(text: str, start: int, end: int) -> bool:
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+    def as_entity_chain(self, fallback: Optional[RunnableSerializable] = None) -> RunnableSerializable:
+        """
+        Wraps the gazetteer as a drop-in for `Entities.get_entity_chain`. `fallback` is only invoked
+        when no known entity is mentioned in the question.
+        """
+        def recognize(inputs: dict) -> Entities:
+            names = self.match(inputs["question"])
+            if names or fallback is None:
+                metrics.inc("entity_recognizer_total", recognizer="gazetteer" if names else "none")
+                return Entities(names=names)
+            metrics.inc("entity_recognizer_total", recognizer="llm")
+            return fallback.invoke(inputs)
+
+        return RunnableLambda(recognize)
@@ -0,0 +1,96 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from db.events import on_graph_changed
+from internal.metrics.metrics import metrics
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 1024))
+DEFAULT_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", 300))
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_PATTERN = re.compile(r"[\s?!.]+$")
+
+metrics.describe("retrieval_cache_total", "Retrieval cache lookups, by result.")
+
+
+def normalize_question(question: str) -> str:
+    """Case, surrounding whitespace, inner runs of whitespace and trailing `?!.` do not change the key."""
+    question = _WHITESPACE_PATTERN.sub(" ", question.casefold()).strip()
+    return _TRAILING_PUNCTUATION_PATTERN.sub("", question)
+
+
+@dataclass
+class RetrievalCache:
+    """
+    Bounded LRU cache of retrieval contexts keyed on the normalized standalone question.
+
+    Entries expire `ttl_seconds` after they are stored. Every graph write made by this process through
+    one of the engines clears the cache; writes from other processes are only picked up once the TTL
+    has passed, so ingest jobs that run separately should call `invalidate` or keep the TTL short.
+    """
+    max_entries: int = DEFAULT_MAX_ENTRIES
+    ttl_seconds: float = DEFAULT_TTL_SECONDS
+    clock: Callable[[], float] = time.monotonic
+    _entries: OrderedDict = field(init=False, default_factory=OrderedDict, repr=False)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+    _generation: int = field(init=False, default=0, repr=False)
+
+    def __post_init__(self):
+        if self.max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {self.max_entries}.")
+        on_graph_changed(self.invalidate)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def generation(self) -> int:
+        """Changes on every full invalidation; pass the value read before computing a context to `put`."""
+        return self._generation
+
+    def get(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                metrics.inc("retrieval_cache_total", result="miss")
+                return None
+            self._entries.move_to_end(key)
+        metrics.inc("retrieval_cache_total", result="hit")
+        return entry[1]
+
+    def put(self, question: str, context: str, generation: Optional[int] = None):
+        key = normalize_question(question)
+        with self._lock:
+            # A context computed before the last invalidation may already describe an outdated graph
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (self.clock() + self.ttl_seconds, context)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, question: str, compute: Callable[[str], str]) -> str:
+        context = self.get(question)
+        if context is None:
+            generation = self.generation
+            context = compute(question)
+            self.put(question, context, generation)
+        return context
+
+    def invalidate(self, question: Optional[str] = None):
+        """Drops the entry for `question`, or every entry when no question is given."""
+        with self._lock:
+            if question is None:
+                self._entries.clear()
+                self._generation += 1
+            else:
+                self._entries.pop(normalize_question(question), None)
@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional, Union
+
+from db.memory.memory_graph import InMemoryGraphEngine
+from db.neo4j.neo4j_connector import Neo4jEngine
+from internal.langchain.bulk_wikipedia_loader import BulkWikipediaLoader
+from internal.langchain.chunk_manifest import ChunkManifest
+from internal.langchain.wikipedia_api import WikipediaDocumentLoader
+from internal.llm.bart import BartLLM
+from internal.llm.canonicalizer import IncrementalCanonicalizer
+from internal.llm.openai import ChatGptLLM
+
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_WRITE_BATCH_SIZE = 100
+# Rows buffered for a write are flushed after this long even if the batch is not full
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+_END_OF_STREAM = object()
+# Yielded by a stage given an `idle_timeout` when nothing arrived in time
+_IDLE = object()
+
+
+@dataclass
+class _StageError:
+    error: BaseException
+
+
+def _run_stage(items: Iterable, queue_size: int, name: str, idle_timeout: Optional[float] = None) -> Iterator:
+    """
+    Consumes `items` on a background thread into a bounded queue and returns a generator over the queue.
+
+    The producer blocks while the queue is full, so a slow downstream stage holds back the upstream ones
+    instead of letting work pile up in memory. Exceptions raised upstream are re-raised in the consumer.
+
+    :param idle_timeout: When set, the generator yields `_IDLE` after waiting this long for an item.
+    """
+    buffer = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(_END_OF_STREAM)
+        except BaseException as e:
+            buffer.put(_StageError(e))
+
+    def consume():
+        try:
+            while True:
+                try:
+                    item = buffer.get(timeout=idle_timeout)
+                except queue.Empty:
+                    yield _IDLE
+                    continue
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, _StageError):
+                    raise item.error
+                yield item
+        finally:
+            # Lets the producer thread exit if the consumer stops early
+            stop.set()
+
+    threading.Thread(target=produce, name=f"pipeline-{name}", daemon=True).start()
+    return consume()
+
+
+@dataclass
+class StreamingPipeline:
+    """
+    Connects loading, splitting, relationship extraction and graph writes through bounded queues.
+
+    Each stage runs on its own thread and hands items to the next one as soon as they are ready, so
+    memory stays flat regardless of how many pages are processed, and the first relationships are
+    written while later chunks are still being extracted. As in the stage-by-stage run, chunks already
+    in the manifest are skipped, entity names are canonicalized before they are written, and a chunk
+    is marked processed once its rows are in the graph.
+
+    :param write_batch_size: Rows per write transaction; smaller batches reach the graph sooner.
+    :param flush_interval: Seconds a buffered row may wait for its batch to fill before it is written.
+    :param manifest: Chunk manifest to skip and record processed chunks, None to process every chunk.
+    """
+    loader: Union[WikipediaDocumentLoader, BulkWikipediaLoader]
+    extractor: Union[ChatGptLLM, BartLLM]
+    engine: Union[Neo4jEngine, InMemoryGraphEngine]
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL
+    manifest: Optional[ChunkManifest] = None
+    canonicalizer: IncrementalCanonicalizer = field(default_factory=IncrementalCanonicalizer)
+
+    def run(self) -> int:
+        """Runs every stage to completion and returns the number of relationships written."""
+        documents = _run_stage(self.loader.lazy_load(), self.queue_size, "load")
+        chunks = _run_stage(self.loader.iter_chunks(documents), self.queue_size, "split")
+        if self.manifest is not None:
+            chunks = self.manifest.iter_new(chunks)
+        extractions = _run_stage(self.extractor.iter_extractions(chunks), self.queue_size, "extract",
+                                 idle_timeout=self.flush_interval)
+
+        total = 0
+        rows, done_chunks, first_buffered = [], [], None
+        for item in extractions:
+            if item is not _IDLE:
+                chunk, chunk_rows = item
+                # A failed chunk is neither written nor marked, so the next run extracts it again
+                if chunk_rows is not None:
+                    rows.extend(self.canonicalizer.canonicalize_rows(chunk_rows))
+                    done_chunks.append(chunk)
+                    first_buffered = first_buffered or time.monotonic()
+            if done_chunks and (len(rows) >= self.write_batch_size
+                                or time.monotonic() - first_buffered >= self.flush_interval):
+                total += self._flush(rows, done_chunks)
+                rows, done_chunks, first_buffered = [], [], None
+        if done_chunks:
+            total += self._flush(rows, done_chunks)
+        return total
+
+    def _flush(self, rows: list, chunks: list) -> int:
+        written = self.engine.store_relationships_batched(rows, self.write_batch_size) if rows else 0
+        if self.manifest is not None:
+            self.manifest.mark_processed(chunks)
+        return written
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, List
+
+import tiktoken
+from langchain.docstore.document import Document
+
+DEFAULT_ENCODING = "gpt2"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """Returns the tiktoken encoding, built once per process and shared by every chunker."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+@dataclass(frozen=True)
+class TokenChunk:
+    """A window of tokens and the `[start, end)` character span it covers in the source text."""
+    text: str
+    start: int
+    end: int
+    token_start: int
+    token_end: int
+
+
+@dataclass
+class TokenChunker:
+    """
+    Splits text into overlapping token windows like `TokenTextSplitter`, but encodes each text only once.
+
+    Windows are cut by token offsets and their text is sliced out of the document by character offsets,
+    instead of decoding every window separately.
+    """
+    chunk_size: int = 512
+    chunk_overlap: int = 128
+    encoding_name: str = DEFAULT_ENCODING
+
+    def __post_init__(self):
+        if not 0 <= self.chunk_overlap < self.chunk_size:
+            raise ValueError(f"chunk_overlap ({self.chunk_overlap}) must be smaller than chunk_size "
+                             f"({self.chunk_size}).")
+
+    def iter_text_chunks(self, text: str) -> Iterator[TokenChunk]:
+        encoding = get_encoding(self.encoding_name)
+        tokens = encoding.encode(text, disallowed_special=())
+        if not tokens:
+            return
+        # offsets[i] is the character at which token i starts; a token that begins in the middle of a
+        # multi-byte character is mapped to the start of that character
+        decoded, offsets = encoding.decode_with_offsets(tokens)
+
+        step = self.chunk_size - self.chunk_overlap
+        for token_start in range(0, len(tokens), step):
+            token_end = min(token_start + self.chunk_size, len(tokens))
+            start = offsets[token_start]
+            end = offsets[token_end] if token_end < len(tokens) else len(decoded)
+            yield TokenChunk(decoded[start:end], start, end, token_start, token_end)
+            if token_end == len(tokens):
+                break
+
+    def chunk_text(self, text: str) -> List[TokenChunk]:
+        return list(self.iter_text_chunks(text))
+
+    def iter_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        for document in documents:
+            for chunk in self.iter_text_chunks(document.page_content):
+                yield Document(page_content=chunk.text, metadata={
+                    **document.metadata, "start_index": chunk.start, "end_index": chunk.end})
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        return list(self.iter_documents(documents))
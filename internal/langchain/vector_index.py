@@ -0,0 +1,378 @@
+import json
+import math
+import os
+import re
+import threading
+import uuid
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional, Sequence
+
+import numpy as np
+from langchain_community.graphs import Neo4jGraph
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from internal.langchain.embedding_store import EmbeddingStore
+from internal.metrics.metrics import metrics
+
+DEFAULT_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", ".vector_index")
+# Below this many vectors a full scan is both exact and fast enough
+IVF_THRESHOLD = 50_000
+DEFAULT_NPROBE = 8
+# Rows scored per matrix multiply, which bounds the memory a scan of the memory map needs
+SCAN_BLOCK_ROWS = 65_536
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+# Only element ids cross the wire for nodes the local index may still need; `$known` maps every indexed
+# document id to the `text_hash` it was indexed with, or to '' when that is not known
+PENDING_GRAPH_DOCUMENTS_QUERY = """
+MATCH (n:`{label}`)
+WHERE n.`{text}` IS NOT NULL AND n.`{embedding}` IS NOT NULL
+WITH n, coalesce(n.id, elementId(n)) AS id
+WHERE $known[id] IS NULL OR ($known[id] <> '' AND $known[id] <> coalesce(n.text_hash, ''))
+RETURN elementId(n) AS element_id
+"""
+GRAPH_DOCUMENTS_PAGE_QUERY = """
+MATCH (n) WHERE elementId(n) IN $element_ids
+RETURN coalesce(n.id, elementId(n)) AS id, n.`{text}` AS text, n.`{embedding}` AS embedding,
+       n.text_hash AS text_hash
+"""
+DEFAULT_GRAPH_PAGE_SIZE = 1_000
+
+metrics.describe("vector_search_seconds", "Latency of one NumpyVectorIndex search, by method.")
+
+
+def _tokens(text: str) -> list[str]:
+    return [token.casefold() for token in _TOKEN_PATTERN.findall(text)]
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the `k` highest scores, highest first, without sorting the whole array."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+@dataclass
+class _InvertedFileIndex:
+    """
+    Approximate index that clusters the unit-normalized vectors with spherical k-means and, at query
+    time, only scores the rows of the `nprobe` clusters closest to the query.
+    """
+    centroids: np.ndarray
+    rows: np.ndarray
+    offsets: np.ndarray
+    size: int
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, norms: np.ndarray, iterations: int = 10, seed: int = 0) -> "_InvertedFileIndex":
+        size = len(matrix)
+        clusters = max(1, int(4 * math.sqrt(size)))
+        rng = np.random.default_rng(seed)
+        # Centroids are trained on a sample, then every row is assigned to its nearest one
+        sample_rows = np.sort(rng.choice(size, min(size, clusters * 32), replace=False))
+        sample = matrix[sample_rows] / norms[sample_rows, None]
+        centroids = sample[rng.choice(len(sample), clusters, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            # A cluster that lost all of its rows keeps its previous centroid
+            filled, starts = np.unique(assignment[order], return_index=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            centroids[filled] = sums / np.maximum(np.linalg.norm(sums, axis=1), 1e-12)[:, None]
+
+        assignment = np.empty(size, dtype=np.int64)
+        for start in range(0, size, SCAN_BLOCK_ROWS):
+            block = matrix[start:start + SCAN_BLOCK_ROWS]
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        rows = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=clusters))))
+        return cls(centroids, rows, offsets, size)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probed = _top_k(self.centroids @ query, nprobe)
+        return np.concatenate([self.rows[self.offsets[cluster]:self.offsets[cluster + 1]] for cluster in probed])
+
+
+@dataclass
+class NumpyVectorIndex(VectorStore):
+    """
+    Local vector store that can stand in for `Neo4jVector` in `Queries`.
+
+    Vectors live in an `EmbeddingStore` memory map under `path`, and documents are appended to
+    `documents.jsonl` next to it, so the index reopens without re-embedding anything. Searches score
+    every row with blocked matrix multiplies until the index holds `ivf_threshold` vectors, then go
+    through an inverted file index. The index is built on a background thread once the threshold is
+    crossed and rebuilt once the corpus has doubled; until it is ready, and for rows added since the
+    last build, searches scan exactly. With `search_type="hybrid"`, BM25 keyword scores are
+    merged in the way `Neo4jVector` merges its fulltext scores: both lists are normalized by their
+    best score and each document keeps the higher of the two.
+    """
+    embedding: Optional[Embeddings] = None
+    path: str = DEFAULT_INDEX_PATH
+    search_type: str = "hybrid"
+    ivf_threshold: int = IVF_THRESHOLD
+    nprobe: int = DEFAULT_NPROBE
+    _store: EmbeddingStore = field(init=False, repr=False)
+    _documents: list[dict] = field(init=False, default_factory=list, repr=False)
+    _row_documents: np.ndarray = field(init=False, repr=False)
+    _norms: np.ndarray = field(init=False, repr=False)
+    # Per token, the positions of the documents containing it and its frequency in each, as flat
+    # arrays that NumPy reads without copying
+    _postings: dict[str, tuple[array, array]] = field(init=False, default_factory=dict, repr=False)
+    _document_lengths: array = field(init=False, default_factory=lambda: array('f'), repr=False)
+    _ivf: Optional[_InvertedFileIndex] = field(init=False, default=None, repr=False)
+    _ivf_thread: Optional[threading.Thread] = field(init=False, default=None, repr=False)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        if self.search_type not in ("vector", "hybrid"):
+            raise ValueError(f"search_type must be 'vector' or 'hybrid', got {self.search_type!r}.")
+        os.makedirs(self.path, exist_ok=True)
+        self._store = EmbeddingStore(os.path.join(self.path, "vectors"))
+        self._row_documents = np.full(len(self._store), -1, dtype=np.int64)
+        self._norms = self._row_norms(0, len(self._store))
+        if os.path.exists(self._documents_path):
+            with open(self._documents_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        self._index_document(json.loads(line))
+        self._schedule_index_build()
+
+    @property
+    def _documents_path(self) -> str:
+        return os.path.join(self.path, "documents.jsonl")
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _row_norms(self, start: int, end: int) -> np.ndarray:
+        matrix = self._store.matrix()
+        norms = np.concatenate([np.linalg.norm(matrix[block:min(block + SCAN_BLOCK_ROWS, end)], axis=1)
+                                for block in range(start, end, SCAN_BLOCK_ROWS)] or [np.empty(0, np.float32)])
+        # Zero vectors score 0 against everything instead of dividing by zero
+        return np.where(norms > 0, norms, 1.0).astype(np.float32)
+
+    def _index_document(self, document: dict):
+        position = len(self._documents)
+        self._documents.append(document)
+        self._row_documents[document["row"]] = position
+        frequencies = Counter(_tokens(document["text"]))
+        self._document_lengths.append(sum(frequencies.values()))
+        for token, frequency in frequencies.items():
+            positions, counts = self._postings.setdefault(token, (array('q'), array('f')))
+            positions.append(position)
+            counts.append(frequency)
+
+    def build_index(self):
+        """Builds the inverted file index over every row added so far; searches keep using the old one meanwhile."""
+        rows = len(self._norms)
+        if rows:
+            self._ivf = _InvertedFileIndex.build(self._store.matrix()[:rows], self._norms[:rows])
+
+    def _schedule_index_build(self):
+        # k-means over a large corpus takes seconds, far more than a search may, so it runs on its own
+        # thread and searches scan exactly until the first index is ready
+        rows = len(self._norms)
+        if rows < self.ivf_threshold or (self._ivf is not None and rows < 2 * self._ivf.size):
+            return
+        if self._ivf_thread is not None and self._ivf_thread.is_alive():
+            return
+        self._ivf_thread = threading.Thread(target=self.build_index, name="ivf-build", daemon=True)
+        self._ivf_thread.start()
+
+    # Writes
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[list[dict]] = None,
+                  ids: Optional[list[str]] = None, **kwargs: Any) -> list[str]:
+        if self.embedding is None:
+            raise ValueError("NumpyVectorIndex needs an embedding model to add texts, use add_embeddings instead.")
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    def add_embeddings(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]],
+                       metadatas: Optional[Sequence[dict]] = None, ids: Optional[Sequence[str]] = None) -> list[str]:
+        """
+        Adds texts whose vectors were computed elsewhere. A text that is already indexed is skipped and
+        keeps its original id.
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        keys = [self._store.key(text) for text in texts]
+        with self._lock:
+            new = {key: position for position, key in enumerate(keys) if key not in self._store}
+            self._store.put(list(new), [embeddings[position] for position in new.values()])
+
+            previous_rows = len(self._row_documents)
+            rows = len(self._store)
+            self._row_documents = np.concatenate(
+                (self._row_documents, np.full(rows - previous_rows, -1, dtype=np.int64)))
+            self._norms = np.concatenate((self._norms, self._row_norms(previous_rows, rows)))
+
+            with open(self._documents_path, 'a', encoding='utf-8') as file:
+                for key, position in new.items():
+                    document = {"id": ids[position], "text": texts[position], "metadata": metadatas[position],
+                                "row": self._store.rows([key])[0]}
+                    file.write(json.dumps(document) + "\n")
+                    self._index_document(document)
+        self._schedule_index_build()
+        return [ids[position] for position in new.values()]
+
+    # Reads
+
+    def _scan_rows(self, queries: np.ndarray, k: int, start: int, end: int) -> tuple[np.ndarray, np.ndarray]:
+        """Exact cosine top-k of every unit-length query over the rows in `[start, end)`, one block at a time."""
+        matrix = self._store.matrix()
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for block in range(start, end, SCAN_BLOCK_ROWS):
+            stop = min(block + SCAN_BLOCK_ROWS, end)
+            scores = (queries @ matrix[block:stop].T) / self._norms[block:stop]
+            rows = np.broadcast_to(np.arange(block, stop), scores.shape)
+            scores = np.concatenate((best_scores, scores), axis=1)
+            rows = np.concatenate((best_rows, rows), axis=1)
+            keep = np.stack([_top_k(row_scores, k) for row_scores in scores])
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+        return best_rows, best_scores
+
+    def _search_vectors(self, queries: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        queries = np.asarray(queries, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+        rows = len(self._norms)
+        if rows == 0:
+            return [[] for _ in queries]
+        ivf = self._ivf
+        if rows < self.ivf_threshold or ivf is None:
+            best_rows, best_scores = self._scan_rows(queries, k, 0, rows)
+            return [list(zip(row_ids.tolist(), scores.tolist())) for row_ids, scores in zip(best_rows, best_scores)]
+
+        matrix = self._store.matrix()
+        results = []
+        for query in queries:
+            candidates = ivf.candidates(query, self.nprobe)
+            scores = (matrix[candidates] @ query) / self._norms[candidates]
+            # Rows added since the index was built are not in any cluster yet
+            tail_rows, tail_scores = self._scan_rows(query[None, :], k, ivf.size, rows)
+            candidates = np.concatenate((candidates, tail_rows[0]))
+            scores = np.concatenate((scores, tail_scores[0]))
+            best = _top_k(scores, k)
+            results.append(list(zip(candidates[best].tolist(), scores[best].tolist())))
+        return results
+
+    def _keyword_search(self, query: str, k: int) -> list[tuple[int, float]]:
+        """BM25 scores of the documents that share a token with `query`, best first."""
+        # The arrays cannot grow while NumPy views of them exist, so additions wait for the scoring
+        with self._lock:
+            lengths = np.frombuffer(self._document_lengths, dtype=np.float32)
+            documents = len(lengths)
+            if not documents:
+                return []
+            length_norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / lengths.mean())
+            scores = np.zeros(documents, dtype=np.float32)
+            for token in set(_tokens(query)):
+                postings = self._postings.get(token)
+                if postings is not None:
+                    scores += self._token_scores(postings, documents, length_norms)
+            # Drop the last view before the lock is released
+            del lengths
+        best = _top_k(scores, k)
+        return [(position, score) for position, score in zip(best.tolist(), scores[best].tolist()) if score > 0]
+
+    @staticmethod
+    def _token_scores(postings: tuple[array, array], documents: int, length_norms: np.ndarray) -> np.ndarray:
+        """BM25 contribution of one token to every document; the views of the postings die with the call."""
+        positions = np.frombuffer(postings[0], dtype=np.int64)
+        counts = np.frombuffer(postings[1], dtype=np.float32)
+        idf = math.log(1 + (documents - len(positions) + 0.5) / (len(positions) + 0.5))
+        scores = np.zeros(documents, dtype=np.float32)
+        # A token occurs at most once per posting list, so the fancy-indexed assignment never collides
+        scores[positions] = idf * counts * (BM25_K1 + 1) / (counts + length_norms[positions])
+        return scores
+
+    def _to_documents(self, scored: Iterable[tuple[int, float]]) -> list[tuple[Document, float]]:
+        results = []
+        for position, score in scored:
+            document = self._documents[position]
+            results.append((Document(page_content=document["text"],
+                                     metadata={**document["metadata"], "id": document["id"]}), score))
+        return results
+
+    def search_batch(self, embeddings: Sequence[Sequence[float]], k: int = 4) -> list[list[tuple[Document, float]]]:
+        """Vector-only top-k for several query vectors at once, sharing one pass over the matrix."""
+        with metrics.timer("vector_search_seconds", method="batch"):
+            results = self._search_vectors(np.asarray(embeddings, dtype=np.float32), k)
+        return [self._to_documents((self._row_documents[row], score) for row, score in result
+                                   if self._row_documents[row] >= 0) for result in results]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [document for document, _ in self.search_batch([embedding], k)[0]]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        if self.embedding is None:
+            raise ValueError("NumpyVectorIndex needs an embedding model to search by text.")
+        vector = self.embedding.embed_query(query)
+        with metrics.timer("vector_search_seconds", method=self.search_type):
+            vector_hits = [(self._row_documents[row], score) for row, score in self._search_vectors([vector], k)[0]
+                           if self._row_documents[row] >= 0]
+            if self.search_type == "vector":
+                return self._to_documents(vector_hits)
+
+            merged: dict[int, float] = {}
+            for hits in (vector_hits, self._keyword_search(query, k)):
+                if not hits:
+                    continue
+                best = max(score for _, score in hits)
+                best = best if best > 0 else 1.0
+                for position, score in hits:
+                    merged[position] = max(merged.get(position, 0.0), score / best)
+            ranked = sorted(merged.items(), key=lambda item: -item[1])[:k]
+            return self._to_documents(ranked)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: Optional[list[dict]] = None,
+                   **kwargs: Any) -> "NumpyVectorIndex":
+        index = cls(embedding, **kwargs)
+        index.add_texts(texts, metadatas)
+        return index
+
+    @classmethod
+    def from_graph(cls, graph: Neo4jGraph, embedding: Embeddings, node_label: str = "Document",
+                   text_node_property: str = "text", embedding_node_property: str = "embedding",
+                   page_size: int = DEFAULT_GRAPH_PAGE_SIZE, **kwargs: Any) -> "NumpyVectorIndex":
+        """
+        Copies the already embedded `node_label` nodes of the graph into a local index, without
+        embedding anything. Only nodes that are not indexed yet, or whose `text_hash` changed since
+        they were, are read, `page_size` at a time.
+        """
+        index = cls(embedding, **kwargs)
+        known = {document["id"]: document["metadata"].get("text_hash") or "" for document in index._documents}
+        pending = graph.query(PENDING_GRAPH_DOCUMENTS_QUERY.format(
+            label=node_label, text=text_node_property, embedding=embedding_node_property), {"known": known})
+        page_query = GRAPH_DOCUMENTS_PAGE_QUERY.format(text=text_node_property, embedding=embedding_node_property)
+
+        added = 0
+        for start in range(0, len(pending), page_size):
+            rows = graph.query(page_query, {
+                "element_ids": [row["element_id"] for row in pending[start:start + page_size]]})
+            added += len(index.add_embeddings(
+                [row["text"] for row in rows], [row["embedding"] for row in rows],
+                [{"source": node_label, "text_hash": row["text_hash"]} for row in rows],
+                [str(row["id"]) for row in rows]))
+        print(f"Indexed {added} new {node_label} nodes, {len(index)} in {index.path}")
+        return index
@@ -1,10 +1,18 @@
 from dataclasses import dataclass, field
-from typing import List, Union
+from typing import Iterable, Iterator, List, Union
 from langchain.docstore.document import Document
 from langchain.text_splitter import TokenTextSplitter
 from langchain_community.utilities import WikipediaAPIWrapper
 from langchain_community.document_loaders import WikipediaLoader
 
+from internal.langchain.chunk_manifest import CONTENT_HASH_KEY, content_hash
+from internal.langchain.token_chunker import TokenChunker
+from internal.metrics.metrics import metrics
+
+metrics.describe("wikipedia_fetch_seconds", "Time to fetch one Wikipedia page.")
+metrics.describe("split_seconds", "Time to split one document into chunks.")
+metrics.describe("chunks_total", "Chunks produced by splitting documents.")
+
 
 @dataclass
 class WikipediaDocumentLoader:
@@ -12,6 +20,7 @@ class WikipediaDocumentLoader:
     page_title: str
     wiki_parser: WikipediaAPIWrapper = field(init=False, default_factory=WikipediaAPIWrapper)
     text_splitter: TokenTextSplitter = field(init=False, default=TokenTextSplitter(chunk_size=512, chunk_overlap=128))
+    chunker: TokenChunker = field(init=False, default_factory=lambda: TokenChunker(chunk_size=512, chunk_overlap=128))
 
     def load_page(self) -> list[Document]:
         return WikipediaLoader(query=self.page_title).load()
@@ -24,22 +33,35 @@ class WikipediaDocumentLoader:
         Load content from the Wikipedia page and wrap it in a Document format.
         Returns a list with a single Document containing the full page content.
         """
-        content = self.wiki_parser.run(self.page_title)
+        with metrics.timer("wikipedia_fetch_seconds"):
+            content = self.wiki_parser.run(self.page_title)
         return [Document(page_content=content, metadata={"source": self.page_title})]
 
+    def lazy_load(self) -> Iterator[Document]:
+        yield from self.load()
+
     def split_document(self, raw_documents: Union[List[Document], Document]) -> List[Document]:
         if isinstance(raw_documents, Document):
             raw_documents = [raw_documents]
+        return list(self.iter_chunks(raw_documents))
+
+    def iter_chunks(self, raw_documents: Iterable[Document]) -> Iterator[Document]:
+        return iter_document_chunks(self.chunker, raw_documents)
 
-        # Check the number of chunks before returning
-        chunks = []
-        for doc in raw_documents:
-            print(f"Document content:\n{doc.page_content[:500]}...")  # Print first 500 characters for debug
-            doc_chunks = self.text_splitter.split_documents([doc])
-            print(f"Number of chunks: {len(doc_chunks)}")  # Print the number of chunks created
-            chunks.extend(doc_chunks)
 
-        return chunks
+def iter_document_chunks(chunker: TokenChunker, raw_documents: Iterable[Document]) -> Iterator[Document]:
+    """
+    Splits documents one at a time, yielding each document's chunks before reading the next document.
+    Every chunk carries the `content_hash` of its text that `ChunkManifest` keys on.
+    """
+    for doc in raw_documents:
+        with metrics.timer("split_seconds"):
+            doc_chunks = chunker.split_documents([doc])
+        metrics.inc("chunks_total", len(doc_chunks))
+        for chunk in doc_chunks:
+            # Stable across runs, so unchanged chunks can be skipped on re-ingest
+            chunk.metadata[CONTENT_HASH_KEY] = content_hash(chunk.page_content)
+            yield chunk
 
 
 # Usage
@@ -1,20 +1,86 @@
+import os
 from dataclasses import dataclass, field
-from transformers import pipeline, Pipeline
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional
 
+from internal.llm.bart_pool import BART_MODEL, BART_TASK, SUMMARY_KWARGS, BartWorkerPool
+from internal.llm.cooccurrence import CooccurrenceBuilder
 from internal.llm.llm import LLMBase
+from internal.llm.model_registry import model_registry
+from internal.metrics.metrics import metrics
+
+if TYPE_CHECKING:
+    from transformers import Pipeline
 
 
 @dataclass
 class BartLLM(LLMBase):
     chunks: list[str]
-    _bart_pipeline: Pipeline = field(init=False)
+    batch_size: int = field(default=8)
+    model: str = field(default=BART_MODEL)
+
+    @staticmethod
+    def preload(model: str = BART_MODEL):
+        """Starts loading the model in the background so that the first summary does not wait for it."""
+        return model_registry.preload(BART_TASK, model)
 
-    def __post_init__(self):
-        self._bart_pipeline = pipeline("summarization", model="facebook/bart-large-cnn")
+    @property
+    def _bart_pipeline(self) -> "Pipeline":
+        # Loaded on first use and shared with every other BartLLM using the same model
+        return model_registry.get(BART_TASK, self.model)
 
     def generate_summary(self):
         summaries = []
         for chunk in self.chunks:
-            summary = self._bart_pipeline(chunk, max_length=200, min_length=50, do_sample=False)
+            summary = self._bart_pipeline(chunk, **SUMMARY_KWARGS)
             summaries.append(summary[0]['summary_text'])
         return summaries
+
+    def iter_extractions(self, chunks: Iterable) -> Iterator[tuple[Any, list[list[str]]]]:
+        """
+        Summarizes chunks `batch_size` at a time and yields `(chunk, rows)` in chunk order, where `rows`
+        are the `[entity1, "RELATED", entity2]` rows of the entities that share a sentence in its summary.
+        """
+        chunk_iterator = iter(chunks)
+        while batch := list(islice(chunk_iterator, self.batch_size)):
+            texts = [getattr(chunk, "page_content", chunk) for chunk in batch]
+            for chunk, summary in zip(batch, BartLLM(texts, self.batch_size, self.model).generate_summary_batched()):
+                builder = CooccurrenceBuilder(window=1, unit="sentence")
+                builder.add_text(summary)
+                yield chunk, [[relationship["entity1"], relationship["relationship_type"], relationship["entity2"]]
+                              for relationship in builder.triples()]
+
+    def iter_relationships(self, chunks: Iterable) -> Iterator[list[str]]:
+        """Yields the `[entity1, "RELATED", entity2]` rows of every chunk, see `iter_extractions`."""
+        for _, rows in self.iter_extractions(chunks):
+            yield from rows
+
+    def generate_summary_batched(self, batch_size: Optional[int] = None):
+        """
+        Summarizes the chunks `batch_size` at a time. Chunks are sorted by token length first so that
+        each batch is padded only up to its own longest chunk; summaries come back in chunk order.
+        """
+        batch_size = batch_size or self.batch_size
+        input_ids = self._bart_pipeline.tokenizer(self.chunks, truncation=True)["input_ids"]
+        order = sorted(range(len(self.chunks)), key=lambda index: len(input_ids[index]))
+
+        summaries = [None] * len(self.chunks)
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            with metrics.timer("bart_batch_seconds", "Time to summarize one batch of chunks.", model=self.model):
+                outputs = self._bart_pipeline([self.chunks[index] for index in bucket], batch_size=len(bucket),
+                                              truncation=True, **SUMMARY_KWARGS)
+            metrics.inc("bart_summaries_total", len(bucket), model=self.model)
+            for index, output in zip(bucket, outputs):
+                summaries[index] = output['summary_text']
+        return summaries
+
+    def generate_summary_parallel(self, workers: Optional[int] = None, threads_per_worker: int = 1):
+        """
+        Summarizes the chunks on a pool of worker processes, each with its own copy of the model.
+
+        :param workers: Number of worker processes, defaults to the number of CPUs.
+        :param threads_per_worker: Number of torch threads in each worker.
+        """
+        with BartWorkerPool(self.model, workers or os.cpu_count() or 1, threads_per_worker) as pool:
+            return list(pool.summarize(self.chunks))
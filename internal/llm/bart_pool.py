@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional
+
+from internal.llm.model_registry import model_registry
+
+BART_TASK = "summarization"
+BART_MODEL = "facebook/bart-large-cnn"
+SUMMARY_KWARGS = {"max_length": 200, "min_length": 50, "do_sample": False}
+
+# Set once per worker process by `_init_worker`
+_worker_model: Optional[str] = None
+
+
+def _init_worker(model: str, torch_threads: int):
+    global _worker_model
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    _worker_model = model
+    model_registry.get(BART_TASK, model)
+
+
+def _summarize_chunk(chunk: str) -> str:
+    summary = model_registry.get(BART_TASK, _worker_model)(chunk, truncation=True, **SUMMARY_KWARGS)
+    return summary[0]['summary_text']
+
+
+@dataclass
+class BartWorkerPool:
+    """
+    Pool of worker processes that each load the BART model once and run it with `threads_per_worker`
+    torch threads, so that chunks are summarized on every core without threads contending for them.
+    """
+    model: str = BART_MODEL
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    threads_per_worker: int = 1
+    _executor: Optional[ProcessPoolExecutor] = field(init=False, default=None, repr=False)
+
+    def __post_init__(self):
+        # spawn rather than fork: a forked child inherits torch's thread pool state from the parent
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model, self.threads_per_worker),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    def summarize(self, chunks: Iterable[str], chunksize: int = 1) -> Iterator[str]:
+        """Yields one summary per chunk, in chunk order, as soon as each next summary is ready."""
+        return self._executor.map(_summarize_chunk, chunks, chunksize=chunksize)
@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+DEFAULT_MAX_SIZE_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+_EVICTION_BATCH = 128
+
+# One cache (and therefore one SQLite connection and one set of counters) per database file in the process.
+_shared_caches: dict[str, "PersistentLLMCache"] = {}
+_shared_caches_lock = threading.Lock()
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PersistentLLMCache(BaseCache):
+    """
+    SQLite-backed langchain LLM cache that survives process restarts.
+
+    Entries are keyed on a hash of the llm string (which carries the model name and temperature) and a
+    hash of the prompt. Once the stored responses exceed `max_size_bytes`, the least recently used
+    entries are evicted. The total size is kept in a metadata row, adjusted by every write, so that
+    eviction never has to scan the table.
+
+    Use `shared_cache` rather than the constructor to get the process-wide instance for a path.
+    """
+    path: str = DEFAULT_CACHE_PATH
+    max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+    size_bytes: int = field(init=False, default=0)
+    _connection: sqlite3.Connection = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        # langchain runs the async cache methods on executor threads, so the connection is shared under a lock.
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    llm_hash TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (llm_hash, prompt_hash)
+                )
+            """)
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # Caches created before the metadata row existed are summed once
+            self._connection.execute(
+                "INSERT OR IGNORE INTO llm_cache_meta SELECT 'size', COALESCE(SUM(size), 0) FROM llm_cache")
+            self.size_bytes = self._read_size()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = (_hash(llm_string), _hash(prompt))
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM llm_cache WHERE llm_hash = ? AND prompt_hash = ?", key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE llm_cache SET last_access = ? WHERE llm_hash = ? AND prompt_hash = ?",
+                    (time.time(), *key))
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        response = json.dumps([dumps(generation) for generation in return_val])
+        key = (_hash(llm_string), _hash(prompt))
+        with self._lock, self._connection:
+            replaced = self._connection.execute(
+                "SELECT size FROM llm_cache WHERE llm_hash = ? AND prompt_hash = ?", key).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                (*key, response, len(response), time.time()))
+            self._add_size(len(response) - (replaced[0] if replaced else 0))
+            self._evict()
+
+    def _read_size(self) -> int:
+        return self._connection.execute("SELECT value FROM llm_cache_meta WHERE key = 'size'").fetchone()[0]
+
+    def _add_size(self, delta: int):
+        # Applied as a delta and read back, so writes from other processes sharing the file are counted too
+        self._connection.execute("UPDATE llm_cache_meta SET value = value + ? WHERE key = 'size'", (delta,))
+        self.size_bytes = self._read_size()
+
+    def _evict(self):
+        total = self.size_bytes
+        while total > self.max_size_bytes:
+            oldest = self._connection.execute(
+                "SELECT rowid, size FROM llm_cache ORDER BY last_access LIMIT ?", (_EVICTION_BATCH,)).fetchall()
+            if not oldest:
+                break
+            evicted = []
+            for rowid, size in oldest:
+                evicted.append((rowid,))
+                total -= size
+                if total <= self.max_size_bytes:
+                    break
+            self._connection.executemany("DELETE FROM llm_cache WHERE rowid = ?", evicted)
+        if total != self.size_bytes:
+            self._add_size(total - self.size_bytes)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM llm_cache")
+            self._connection.execute("UPDATE llm_cache_meta SET value = 0 WHERE key = 'size'")
+            self.size_bytes = 0
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            size = self.size_bytes = self._read_size()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with _shared_caches_lock:
+            if _shared_caches.get(os.path.abspath(self.path)) is self:
+                del _shared_caches[os.path.abspath(self.path)]
+        with self._lock:
+            self._connection.close()
+
+
+def shared_cache(path: str = DEFAULT_CACHE_PATH) -> PersistentLLMCache:
+    """Returns the process-wide cache for the database at `path`, opening it on first use."""
+    key = os.path.abspath(path)
+    with _shared_caches_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = _shared_caches[key] = PersistentLLMCache(path)
+    return cache
+
+
+def warm(page_titles: Sequence[str], path: str = DEFAULT_CACHE_PATH) -> dict:
+    """
+    Runs relationship extraction over the given Wikipedia pages so that later ingests of the same
+    pages are answered from the cache.
+    """
+    from langchain.globals import set_llm_cache
+
+    from internal.langchain.wikipedia_api import WikipediaDocumentLoader
+    from internal.llm.openai import ChatGptLLM
+
+    cache = shared_cache(path)
+    for page_title in page_titles:
+        loader = WikipediaDocumentLoader(page_title)
+        chunks = loader.split_document(loader.load())
+        llm = ChatGptLLM(chunks)
+        set_llm_cache(cache)
+        llm.generate_relationships_csv_concurrent()
+    return cache.stats()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Manage the persistent LLM response cache.")
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm_parser = subparsers.add_parser("warm", help="Pre-populate the cache for the given Wikipedia pages.")
+    warm_parser.add_argument("page_titles", nargs="+")
+    subparsers.add_parser("stats", help="Print the number and size of cached responses.")
+    subparsers.add_parser("clear", help="Remove every cached response.")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        print(warm(args.page_titles, args.path))
+    elif args.command == "stats":
+        print(shared_cache(args.path).stats())
+    else:
+        shared_cache(args.path).clear()
@@ -0,0 +1,311 @@
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+# Titles that may precede a name without changing who it refers to
+DEFAULT_HONORIFICS = frozenset({
+    "the", "emperor", "empress", "king", "queen", "prince", "princess", "saint", "st", "sir", "lord",
+    "lady", "dr", "mr", "mrs", "ms", "general", "consul", "caesar", "augustus",
+})
+
+_MERSENNE_PRIME = (1 << 61) - 1
+DEFAULT_MAX_BUCKET_SIZE = 64
+# Minimum shingle Jaccard similarity for two differing words to count as spellings of the same word
+TOKEN_VARIANT_THRESHOLD = 0.5
+_NON_WORD_PATTERN = re.compile(r"[^\w\s]")
+# Regnal and ordinal numbers, as in "Ptolemy II"; keys are casefolded before they are matched
+_ROMAN_NUMERAL_PATTERN = re.compile(r"m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})")
+
+Row = Union[Sequence[str], dict]
+
+
+def normalize_name(name: str, honorifics: frozenset = DEFAULT_HONORIFICS) -> str:
+    """Casefolds, strips accents and punctuation, and drops leading titles: "Emperor Marcus Aurelius" -> "marcus aurelius"."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    ascii_name = "".join(char for char in decomposed if not unicodedata.combining(char))
+    tokens = _NON_WORD_PATTERN.sub(" ", ascii_name.casefold()).split()
+    while len(tokens) > 1 and tokens[0] in honorifics:
+        tokens.pop(0)
+    return " ".join(tokens)
+
+
+def _is_proper_name(name: str) -> bool:
+    return all(word[0].isupper() for word in name.split() if word.casefold() not in DEFAULT_HONORIFICS)
+
+
+def _shingles(key: str, size: int = 3) -> set[str]:
+    padded = f" {key} "
+    return {padded[i:i + size] for i in range(max(len(padded) - size + 1, 1))}
+
+
+def _tokens_agree(first: str, second: str) -> bool:
+    """Whether every word only one of two keys has is a spelling variant of a word only the other has."""
+    first_tokens, second_tokens = set(first.split()), set(second.split())
+    first_only, second_only = first_tokens - second_tokens, second_tokens - first_tokens
+    if any(_is_number(token) for token in first_only | second_only):
+        return False
+    return all(
+        any(_jaccard(_shingles(token), _shingles(other)) >= TOKEN_VARIANT_THRESHOLD for other in others)
+        for tokens, others in ((first_only, second_only), (second_only, first_only)) for token in tokens)
+
+
+def _is_number(token: str) -> bool:
+    return any(char.isdigit() for char in token) or _ROMAN_NUMERAL_PATTERN.fullmatch(token) is not None
+
+
+def _jaccard(first: set, second: set) -> float:
+    return len(first & second) / len(first | second)
+
+
+class _LshIndex:
+    """Band buckets of MinHash signatures; buckets that grow past `max_bucket_size` stop being compared."""
+
+    def __init__(self, bands: int, rows_per_band: int, max_bucket_size: int):
+        self.bands = bands
+        self.rows_per_band = rows_per_band
+        self.max_bucket_size = max_bucket_size
+        self._buckets: dict[tuple, list[int]] = {}
+
+    def _band_keys(self, signature: np.ndarray) -> Iterator[tuple]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows_per_band:(band + 1) * self.rows_per_band].tobytes()
+
+    def candidates(self, signature: np.ndarray) -> set[int]:
+        """Ids sharing at least one bucket that is not oversized, each reported once across all bands."""
+        found = set()
+        for band_key in self._band_keys(signature):
+            members = self._buckets.get(band_key)
+            if members is not None and len(members) <= self.max_bucket_size:
+                found.update(members)
+        return found
+
+    def add(self, key_id: int, signature: np.ndarray):
+        for band_key in self._band_keys(signature):
+            members = self._buckets.setdefault(band_key, [])
+            # An oversized bucket is never compared again, so its members need not be kept
+            if len(members) <= self.max_bucket_size:
+                members.append(key_id)
+
+
+@dataclass
+class _UnionFind:
+    parent: list[int] = field(default_factory=list)
+
+    def add(self) -> int:
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+    def find(self, item: int) -> int:
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first: int, second: int):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+@dataclass
+class EntityCanonicalizer:
+    """
+    Maps name variants such as "Marcus", "Marcus Aurelius" and "Emperor Marcus Aurelius" to one canonical name.
+
+    Names are grouped by their normalized key, near-duplicate keys are found with a MinHash/LSH index over
+    character shingles (so only names sharing a bucket are ever compared), and a single-word key is merged
+    into the one multi-word cluster that starts or ends with it, if there is exactly one. Clusters are kept
+    in a union-find, and each cluster is named after its most frequent variant.
+
+    Keys that are similar overall still stay apart when they differ in a number or in a word that is not
+    a spelling variant of a word in the other key, so "Ptolemy II" and "Ptolemy III" or "Gaius Julius"
+    and "Gaius Junius" are never merged.
+
+    :param threshold: Minimum shingle Jaccard similarity for two keys to be merged.
+    :param max_bucket_size: Buckets holding more keys than this are ignored; they come from shingles
+        shared by many names, and comparing all of their members would take quadratic time.
+    """
+    threshold: float = 0.7
+    num_perm: int = 64
+    bands: int = 16
+    max_bucket_size: int = DEFAULT_MAX_BUCKET_SIZE
+    honorifics: frozenset = DEFAULT_HONORIFICS
+    seed: int = 7
+
+    def __post_init__(self):
+        if self.num_perm % self.bands:
+            raise ValueError(f"num_perm ({self.num_perm}) must be divisible by bands ({self.bands}).")
+        generator = np.random.default_rng(self.seed)
+        # Coefficients below 2**31 keep a * crc32 + b below 2**64, so the uint64 arithmetic never wraps
+        self._a = generator.integers(1, 1 << 31, self.num_perm, dtype=np.uint64)
+        self._b = generator.integers(0, 1 << 31, self.num_perm, dtype=np.uint64)
+
+    def new_index(self) -> "_LshIndex":
+        return _LshIndex(self.bands, self.num_perm // self.bands, self.max_bucket_size)
+
+    def _similar(self, first: str, first_shingles: set[str], second: str, second_shingles: set[str]) -> bool:
+        return _jaccard(first_shingles, second_shingles) >= self.threshold and _tokens_agree(first, second)
+
+    def _minhash(self, shingles: set[str]) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        return permuted.min(axis=1)
+
+    def fit(self, names: Iterable[str]) -> dict[str, str]:
+        """Returns a mapping from every given name to its canonical name."""
+        counts = Counter(name for name in names if name)
+        keys = {name: normalize_name(name, self.honorifics) for name in counts}
+
+        key_ids: dict[str, int] = {}
+        union_find = _UnionFind()
+        for key in keys.values():
+            if key not in key_ids:
+                key_ids[key] = union_find.add()
+        keys_by_id = {key_id: key for key, key_id in key_ids.items()}
+
+        # Candidate pairs from LSH buckets, verified with the exact Jaccard similarity and token agreement
+        index = self.new_index()
+        key_shingles = {}
+        for key, key_id in key_ids.items():
+            key_shingles[key_id] = shingles = _shingles(key)
+            signature = self._minhash(shingles)
+            for other in index.candidates(signature):
+                if union_find.find(key_id) != union_find.find(other) and self._similar(
+                        key, shingles, keys_by_id[other], key_shingles[other]):
+                    union_find.union(key_id, other)
+            index.add(key_id, signature)
+
+        # A lone first or last name belongs to the only multi-word proper-name cluster it can refer to
+        clusters_by_token: dict[str, set[int]] = {}
+        for name, key in keys.items():
+            tokens = key.split()
+            if len(tokens) > 1 and _is_proper_name(name):
+                key_id = key_ids[key]
+                for token in (tokens[0], tokens[-1]):
+                    clusters_by_token.setdefault(token, set()).add(union_find.find(key_id))
+        for key, key_id in key_ids.items():
+            if " " not in key and len(clusters_by_token.get(key, ())) == 1:
+                union_find.union(key_id, next(iter(clusters_by_token[key])))
+
+        clusters: dict[int, list[str]] = {}
+        for name, key in keys.items():
+            clusters.setdefault(union_find.find(key_ids[key]), []).append(name)
+
+        mapping = {}
+        for members in clusters.values():
+            canonical = max(members, key=lambda name: (counts[name], len(keys[name].split()), -len(name)))
+            for name in members:
+                mapping[name] = canonical
+        return mapping
+
+    def canonicalize_rows(self, rows: Iterable[Row], mapping: Optional[dict[str, str]] = None) -> list[Row]:
+        """
+        Rewrites the endpoints of relationship rows to canonical names, dropping self-loops and duplicates.
+
+        Accepts `[source, relationship, target]` rows, `{"source", "relationship", "target"}` dicts and
+        `{"entity1", "entity2", "relationship_type"}` dicts; weights of merged dict rows are summed.
+
+        :param mapping: A mapping from an earlier `fit`, otherwise one is fitted on the rows' endpoints.
+        """
+        rows = list(rows)
+        if mapping is None:
+            mapping = self.fit(name for row in rows for name in self._endpoints(row))
+
+        canonical_rows: dict[tuple, Row] = {}
+        for row in rows:
+            if isinstance(row, dict):
+                source_key, target_key = ("source", "target") if "source" in row else ("entity1", "entity2")
+                row = {**row, source_key: mapping.get(row[source_key], row[source_key]),
+                       target_key: mapping.get(row[target_key], row[target_key])}
+                source, target = row[source_key], row[target_key]
+                key = (source, row.get("relationship", row.get("relationship_type")), target)
+            else:
+                source, relationship, target = row
+                source, target = mapping.get(source, source), mapping.get(target, target)
+                row = [source, relationship, target]
+                key = (source, relationship, target)
+
+            if source == target:
+                continue
+            if key in canonical_rows:
+                existing = canonical_rows[key]
+                if isinstance(existing, dict) and "weight" in existing:
+                    existing["weight"] += row.get("weight", 1)
+                continue
+            canonical_rows[key] = row
+        return list(canonical_rows.values())
+
+    @staticmethod
+    def _endpoints(row: Row) -> tuple[str, str]:
+        if isinstance(row, dict):
+            if "source" in row:
+                return row["source"], row["target"]
+            return row["entity1"], row["entity2"]
+        return row[0], row[2]
+
+
+@dataclass
+class IncrementalCanonicalizer:
+    """
+    Canonicalizes rows that arrive a few at a time, as in the streaming pipeline, keeping names stable
+    across calls: once a name is given a canonical name it keeps it, and a new variant that matches a
+    name seen before takes that name's canonical name.
+
+    The MinHash/LSH index of every key seen so far is kept between calls, so each call only hashes its
+    new names. The rules are those of `EntityCanonicalizer.fit`, applied in arrival order: a cluster is
+    named after its first variant, and a lone first or last name joins the only multi-word cluster
+    known so far that starts or ends with it.
+    """
+    canonicalizer: EntityCanonicalizer = field(default_factory=EntityCanonicalizer)
+    _mapping: dict[str, str] = field(init=False, default_factory=dict, repr=False)
+    _key_canonicals: dict[str, str] = field(init=False, default_factory=dict, repr=False)
+    _keys: list[str] = field(init=False, default_factory=list, repr=False)
+    _key_shingles: list[set[str]] = field(init=False, default_factory=list, repr=False)
+    _canonicals_by_token: dict[str, set[str]] = field(init=False, default_factory=dict, repr=False)
+    _index: Optional[_LshIndex] = field(init=False, default=None, repr=False)
+
+    def __post_init__(self):
+        self._index = self.canonicalizer.new_index()
+
+    def __len__(self) -> int:
+        return len(self._mapping)
+
+    def _canonical_of_key(self, key: str, name: str) -> str:
+        shingles = _shingles(key)
+        signature = self.canonicalizer._minhash(shingles)
+        canonical = next((self._key_canonicals[self._keys[other]]
+                          for other in sorted(self._index.candidates(signature))
+                          if self.canonicalizer._similar(key, shingles, self._keys[other], self._key_shingles[other])),
+                         None)
+        if canonical is None and " " not in key and len(self._canonicals_by_token.get(key, ())) == 1:
+            canonical = next(iter(self._canonicals_by_token[key]))
+        canonical = canonical or name
+
+        self._index.add(len(self._keys), signature)
+        self._keys.append(key)
+        self._key_shingles.append(shingles)
+        self._key_canonicals[key] = canonical
+        tokens = key.split()
+        if len(tokens) > 1 and _is_proper_name(name):
+            for token in (tokens[0], tokens[-1]):
+                self._canonicals_by_token.setdefault(token, set()).add(canonical)
+        return canonical
+
+    def canonicalize_rows(self, rows: Iterable[Row]) -> list[Row]:
+        rows = list(rows)
+        counts = Counter(name for row in rows for name in EntityCanonicalizer._endpoints(row)
+                         if name and name not in self._mapping)
+        # Multi-word names first, so that a lone name in the same rows can join their cluster
+        for name in sorted(counts, key=lambda name: (" " not in name.strip(), -counts[name])):
+            key = normalize_name(name, self.canonicalizer.honorifics)
+            canonical = self._key_canonicals.get(key)
+            self._mapping[name] = canonical if canonical is not None else self._canonical_of_key(key, name)
+        return self.canonicalizer.canonicalize_rows(rows, self._mapping)
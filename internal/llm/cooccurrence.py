@@ -0,0 +1,131 @@
+import re
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+from internal.llm.entity_extractor import CAPITALIZED_PHRASE_PATTERN, EntityExtractor, entity_extractor
+
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+")
+UNITS = ("sentence", "token")
+# Pending pairs are folded into the sparse matrix once this many have accumulated
+FLUSH_THRESHOLD = 1_000_000
+
+
+@dataclass
+class CooccurrenceBuilder:
+    """
+    Builds weighted, deduplicated entity relationships from co-occurrence within a window.
+
+    Entities are interned to integer ids and every co-occurring pair is counted in a sparse upper
+    triangular matrix, so a pair seen a thousand times costs one matrix entry instead of a thousand
+    relationship dicts.
+
+    :param window: Entities co-occur when they are fewer than `window` units apart.
+    :param unit: `sentence` or `token`.
+    """
+    window: int = 1
+    unit: str = "sentence"
+    extractor: EntityExtractor = entity_extractor
+    _ids: dict[str, int] = field(init=False, default_factory=dict, repr=False)
+    _names: list[str] = field(init=False, default_factory=list, repr=False)
+    _rows: array = field(init=False, default_factory=lambda: array('q'), repr=False)
+    _cols: array = field(init=False, default_factory=lambda: array('q'), repr=False)
+    _matrix: Optional[csr_matrix] = field(init=False, default=None, repr=False)
+
+    def __post_init__(self):
+        if self.unit not in UNITS:
+            raise ValueError(f"unit must be one of {UNITS}, got {self.unit!r}.")
+        if self.window < 1:
+            raise ValueError(f"window must be at least 1, got {self.window}.")
+
+    def _intern(self, name: str) -> int:
+        entity_id = self._ids.get(name)
+        if entity_id is None:
+            entity_id = len(self._names)
+            self._ids[name] = entity_id
+            self._names.append(name)
+        return entity_id
+
+    def _add_positioned(self, positioned: Sequence[tuple[int, int]]):
+        """Counts every pair of `(position, entity_id)` entries that are fewer than `window` positions apart."""
+        rows, cols = self._rows, self._cols
+        for i, (position, first) in enumerate(positioned):
+            for j in range(i + 1, len(positioned)):
+                other_position, second = positioned[j]
+                if other_position - position >= self.window:
+                    break
+                if first == second:
+                    continue
+                rows.append(min(first, second))
+                cols.append(max(first, second))
+        if len(rows) >= FLUSH_THRESHOLD:
+            self._flush()
+
+    def add_entities(self, entities: Sequence[str]):
+        """Adds an already extracted entity stream, treating each entity as one token."""
+        self._add_positioned([(position, self._intern(entity)) for position, entity in enumerate(entities)])
+
+    def add_text(self, text: str):
+        if self.unit == "sentence":
+            positioned = [
+                (position, self._intern(entity))
+                for position, sentence in enumerate(SENTENCE_BOUNDARY_PATTERN.split(text))
+                for entity in self.extractor.extract(sentence)
+            ]
+        else:
+            positioned = []
+            token_position, previous_end = 0, 0
+            for match in CAPITALIZED_PHRASE_PATTERN.finditer(text):
+                token_position += len(text[previous_end:match.start()].split())
+                previous_end = match.start()
+                for entity in self.extractor.iter_entities([match.group()]):
+                    positioned.append((token_position, self._intern(entity)))
+        self._add_positioned(positioned)
+
+    def add_texts(self, texts: Iterable[str]):
+        for text in texts:
+            self.add_text(text)
+
+    def _flush(self):
+        if not self._rows:
+            return
+        size = len(self._names)
+        pending = coo_matrix(
+            (np.ones(len(self._rows), dtype=np.int64),
+             (np.frombuffer(self._rows, dtype=np.int64), np.frombuffer(self._cols, dtype=np.int64))),
+            shape=(size, size),
+        ).tocsr()
+        if self._matrix is not None:
+            self._matrix.resize((size, size))
+            pending = pending + self._matrix
+        self._matrix = pending
+        self._rows, self._cols = array('q'), array('q')
+
+    def matrix(self) -> csr_matrix:
+        """Returns the upper triangular co-occurrence count matrix, indexed by interned entity id."""
+        self._flush()
+        size = len(self._names)
+        if self._matrix is None:
+            return csr_matrix((size, size), dtype=np.int64)
+        self._matrix.resize((size, size))
+        return self._matrix
+
+    def triples(self, min_weight: int = 1) -> list[dict]:
+        """
+        Returns one relationship per co-occurring pair, in the shape of `LLMBase.extract_relationships`
+        plus the number of co-occurrences as `weight`.
+        """
+        counts = self.matrix().tocoo()
+        keep = counts.data >= min_weight
+        return [
+            {
+                "entity1": self._names[first],
+                "entity2": self._names[second],
+                "relationship_type": "RELATED",
+                "weight": int(weight),
+            }
+            for first, second, weight in zip(counts.row[keep], counts.col[keep], counts.data[keep])
+        ]
@@ -0,0 +1,60 @@
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+# Capitalized function words that start sentences or clauses but are never entities themselves
+DEFAULT_STOP_WORDS = frozenset({
+    "a", "after", "also", "although", "an", "and", "as", "at", "before", "but", "by", "during", "for",
+    "from", "he", "her", "his", "however", "if", "in", "it", "its", "of", "on", "or", "she", "since",
+    "so", "that", "the", "their", "these", "they", "this", "those", "to", "under", "when", "where",
+    "which", "while", "who", "with",
+})
+
+# One or more capitalized words separated by spaces, e.g. "Marcus Aurelius"
+CAPITALIZED_PHRASE_PATTERN = re.compile(r"\b[A-Z][a-z]+(?:[ \t]+[A-Z][a-z]+)*\b")
+
+
+@dataclass(frozen=True)
+class EntityExtractor:
+    """
+    Regex-based entity extractor that merges runs of capitalized words into a single entity and drops
+    stop words, so "In The Roman Empire" yields "Roman Empire".
+    """
+    stop_words: frozenset = DEFAULT_STOP_WORDS
+    min_length: int = 2
+
+    def _split_phrase(self, phrase: str) -> Iterator[str]:
+        if " " not in phrase and "\t" not in phrase:
+            if len(phrase) >= self.min_length and phrase.lower() not in self.stop_words:
+                yield phrase
+            return
+
+        # Stop words break a phrase into separate entities
+        current = []
+        for word in phrase.split():
+            if word.lower() in self.stop_words:
+                if current:
+                    yield " ".join(current)
+                    current = []
+            else:
+                current.append(word)
+        if current and (len(current) > 1 or len(current[0]) >= self.min_length):
+            yield " ".join(current)
+
+    def extract(self, text: str) -> list[str]:
+        return list(self.iter_entities([text]))
+
+    def iter_entities(self, texts: Iterable[str]) -> Iterator[str]:
+        """Yields the entities of every text in `texts`, in order, in a single pass."""
+        split_phrase = self._split_phrase
+        for text in texts:
+            for match in CAPITALIZED_PHRASE_PATTERN.finditer(text):
+                yield from split_phrase(match.group())
+
+    def count(self, texts: Iterable[str]) -> Counter:
+        """Counts how often each entity occurs across a stream of texts."""
+        return Counter(self.iter_entities(texts))
+
+
+entity_extractor = EntityExtractor()
@@ -2,17 +2,22 @@ import re
 
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
-from langchain_community.cache import InMemoryCache
+from typing import Optional
+
 from langchain.globals import set_llm_cache
 
+from internal.llm.cache import DEFAULT_CACHE_PATH, shared_cache
+
+CAPITALIZED_WORD_PATTERN = re.compile(r'\b[A-Z][a-z]+\b')
+
 
 @dataclass
 class LLMBase(ABC):
     chunks: list[str]
 
     @staticmethod
-    def enable_cache():
-        set_llm_cache(InMemoryCache())
+    def enable_cache(path: Optional[str] = None):
+        set_llm_cache(shared_cache(path or DEFAULT_CACHE_PATH))
 
     @abstractmethod
     def generate_summary(self):
@@ -21,7 +26,7 @@ class LLMBase(ABC):
     @staticmethod
     def extract_entities(text):
         # Example of a simple regex-based entity extraction. You can use libraries like spaCy or other NER models.
-        entities = re.findall(r'\b[A-Z][a-z]+\b', text)
+        entities = CAPITALIZED_WORD_PATTERN.findall(text)
         return entities
 
     @staticmethod
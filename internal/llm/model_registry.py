@@ -0,0 +1,53 @@
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from transformers import Pipeline
+
+
+@dataclass
+class ModelRegistry:
+    """
+    Process-wide cache of Hugging Face pipelines, keyed by task and model.
+
+    `transformers` is only imported when the first pipeline is built, and each pipeline is built at most
+    once no matter how many threads ask for it at the same time.
+    """
+    _pipelines: dict[tuple[str, str], "Pipeline"] = field(default_factory=dict, repr=False)
+    _key_locks: dict[tuple[str, str], threading.Lock] = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def _key_lock(self, key: tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, task: str, model: str) -> "Pipeline":
+        key = (task, model)
+        loaded = self._pipelines.get(key)
+        if loaded is not None:
+            return loaded
+
+        with self._key_lock(key):
+            loaded = self._pipelines.get(key)
+            if loaded is None:
+                from transformers import pipeline
+
+                loaded = pipeline(task, model=model)
+                self._pipelines[key] = loaded
+        return loaded
+
+    def preload(self, task: str, model: str) -> threading.Thread:
+        """Starts loading a pipeline on a background thread; a later `get` waits for it if it is not done."""
+        thread = threading.Thread(target=self.get, args=(task, model), name=f"preload-{model}", daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, task: str, model: str) -> bool:
+        return (task, model) in self._pipelines
+
+    def unload(self, task: str, model: str):
+        self._pipelines.pop((task, model), None)
+
+
+model_registry = ModelRegistry()
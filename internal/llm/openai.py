@@ -1,12 +1,34 @@
+import asyncio
 import csv
 import io
 import json
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, Optional
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain_openai import ChatOpenAI
 from typing_extensions import deprecated
 
 from internal.llm.llm import LLMBase
+from internal.metrics.metrics import metrics
+
+metrics.describe("llm_request_seconds", "Latency of one relationship extraction request, per chunk.")
+metrics.describe("llm_tokens_total", "Tokens used by relationship extraction requests.")
+metrics.describe("llm_parse_seconds", "Time spent parsing one CSV response.")
+metrics.describe("llm_chunks_total", "Chunks sent to relationship extraction, by outcome.")
+
+
+@dataclass
+class ChunkExtractionResult:
+    """Outcome of extracting relationships from a single chunk."""
+    index: int
+    rows: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 @dataclass
@@ -15,13 +37,15 @@ class ChatGptLLM(LLMBase):
     model: str = field(default="gpt-4o")
     temperature: int = field(default=0)
     max_tokens: int = field(default=500)
+    max_in_flight: int = field(default=8)
+    extraction_results: list[ChunkExtractionResult] = field(init=False, default_factory=list)
 
     @staticmethod
     def __post_init__():
         LLMBase.enable_cache()
 
     @staticmethod
-    def csv_cleaner(response_content):
+    def clean_rows(response_content) -> list[list[str]]:
         cleaned_data = []
 
         for item in response_content:
@@ -32,6 +56,11 @@ class ChatGptLLM(LLMBase):
                     cleaned_data.append([source, relationship, target])
             except Exception as e:
                 continue
+        return cleaned_data
+
+    @staticmethod
+    def csv_cleaner(response_content):
+        cleaned_data = ChatGptLLM.clean_rows(response_content)
 
         # Write to a CSV file
         with open("relationships.csv", "w", newline="") as csvfile:
@@ -41,13 +70,10 @@ class ChatGptLLM(LLMBase):
 
         return cleaned_data
 
-    def generate_relationships_csv(self):
-        llm = ChatOpenAI(model=self.model, temperature=self.temperature, max_tokens=self.max_tokens)
-
-        relationships = []
-        for chunk in self.chunks:
-            # Define the prompt for CSV output
-            prompt = f"""
+    @staticmethod
+    def build_csv_prompt(chunk) -> str:
+        # Define the prompt for CSV output
+        return f"""
             Analyze the following text and extract entities and relationships in CSV format.
             The CSV should have the following columns: 'source', 'relationship', 'target'.
 
@@ -60,15 +86,113 @@ class ChatGptLLM(LLMBase):
 
             Your output should be a CSV with the columns 'source', 'relationship', and 'target'.
             """
+
+    @staticmethod
+    def parse_csv_response(response_content: str) -> list[dict]:
+        # Parse the CSV response
+        with metrics.timer("llm_parse_seconds"):
+            return list(csv.DictReader(io.StringIO(response_content.strip())))
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None) or {}
+        metrics.inc("llm_tokens_total", usage.get("input_tokens", 0), model=self.model, kind="input")
+        metrics.inc("llm_tokens_total", usage.get("output_tokens", 0), model=self.model, kind="output")
+
+    async def agenerate_relationships_csv(self) -> list[ChunkExtractionResult]:
+        """
+        Extracts relationships from every chunk concurrently, with at most `max_in_flight` requests
+        outstanding at a time.
+
+        :return: One result per chunk, in chunk order, holding either the parsed rows or the error.
+        """
+        llm = ChatOpenAI(model=self.model, temperature=self.temperature, max_tokens=self.max_tokens)
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def extract(index, chunk) -> ChunkExtractionResult:
+            async with semaphore:
+                try:
+                    with metrics.timer("llm_request_seconds", model=self.model):
+                        response = await llm.ainvoke([{"role": "user", "content": self.build_csv_prompt(chunk)}])
+                    self._record_usage(response)
+                    result = ChunkExtractionResult(index, self.parse_csv_response(response.content))
+                except Exception as e:
+                    result = ChunkExtractionResult(index, error=f"{type(e).__name__}: {e}")
+                metrics.inc("llm_chunks_total", outcome="ok" if result.ok else "failed")
+                return result
+
+        return list(await asyncio.gather(*(extract(index, chunk) for index, chunk in enumerate(self.chunks))))
+
+    def generate_relationships_csv_concurrent(self):
+        """Concurrent version of `generate_relationships_csv`, producing the same cleaned rows."""
+        results = self.extraction_results = asyncio.run(self.agenerate_relationships_csv())
+
+        for result in results:
+            if not result.ok:
+                print(f"Chunk {result.index} failed: {result.error}")
+        succeeded = sum(result.ok for result in results)
+        print(f"Extracted relationships from {succeeded}/{len(results)} chunks")
+
+        return self.csv_cleaner([row for result in results for row in result.rows])
+
+    def _extract_rows(self, llm: ChatOpenAI, chunk) -> Optional[list[list[str]]]:
+        """Cleaned rows of one chunk, or None when its extraction fails."""
+        try:
+            with metrics.timer("llm_request_seconds", model=self.model):
+                response = llm.invoke([{"role": "user", "content": self.build_csv_prompt(chunk)}])
+            self._record_usage(response)
+            rows = self.clean_rows(self.parse_csv_response(response.content))
+        except Exception as e:
+            metrics.inc("llm_chunks_total", outcome="failed")
+            print(f"Error extracting relationships: {e}")
+            return None
+        metrics.inc("llm_chunks_total", outcome="ok")
+        return rows
+
+    def iter_extractions(self, chunks: Iterable) -> Iterator[tuple[Any, Optional[list[list[str]]]]]:
+        """
+        Extracts relationships with up to `max_in_flight` requests outstanding, yielding `(chunk, rows)`
+        in chunk order as soon as each chunk and every chunk before it has been answered. `rows` holds
+        the cleaned `[source, relationship, target]` rows, or is None when the extraction failed.
+        """
+        llm = ChatOpenAI(model=self.model, temperature=self.temperature, max_tokens=self.max_tokens)
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="extract")
+        in_flight: deque[tuple[Any, Future]] = deque()
+        try:
+            for chunk in chunks:
+                # Finished results are handed on before waiting for the next chunk from upstream
+                while in_flight and in_flight[0][1].done():
+                    done_chunk, future = in_flight.popleft()
+                    yield done_chunk, future.result()
+                if len(in_flight) >= self.max_in_flight:
+                    done_chunk, future = in_flight.popleft()
+                    yield done_chunk, future.result()
+                in_flight.append((chunk, executor.submit(self._extract_rows, llm, chunk)))
+            while in_flight:
+                done_chunk, future = in_flight.popleft()
+                yield done_chunk, future.result()
+        finally:
+            # Requests not yet started are dropped if the consumer stops early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_relationships(self, chunks: Iterable) -> Iterator[list[str]]:
+        """
+        Extracts relationships concurrently, yielding each chunk's cleaned `[source, relationship, target]`
+        rows in chunk order. Chunks whose extraction fails are reported and skipped.
+        """
+        for _, rows in self.iter_extractions(chunks):
+            if rows:
+                yield from rows
+
+    def generate_relationships_csv(self):
+        llm = ChatOpenAI(model=self.model, temperature=self.temperature, max_tokens=self.max_tokens)
+
+        relationships = []
+        for chunk in self.chunks:
+            prompt = self.build_csv_prompt(chunk)
             try:
                 # Call the LLM
                 response = llm([{"role": "user", "content": prompt}])
-                response_content = response.content.strip()
-
-                # Parse the CSV response
-                csv_reader = csv.DictReader(io.StringIO(response_content))
-                for row in csv_reader:
-                    relationships.append(row)
+                relationships.extend(self.parse_csv_response(response.content))
             except Exception as e:
                 print(f"Error parsing response: {e}")
                 print(f"Response received: {response.content.strip()}")
@@ -0,0 +1,181 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+# Seconds, from sub-millisecond retrieval lookups up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for key, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+@dataclass
+class Counter:
+    value: float = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+@dataclass
+class Gauge:
+    value: float = 0
+
+    def set(self, value: float):
+        self.value = value
+
+
+@dataclass
+class Histogram:
+    buckets: tuple = DEFAULT_BUCKETS
+    bucket_counts: list = field(default_factory=list)
+    count: int = 0
+    sum: float = 0.0
+
+    def __post_init__(self):
+        self.bucket_counts = [0] * len(self.buckets)
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list[int]:
+        counts, total = [], 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            counts.append(total)
+        return counts
+
+
+@dataclass
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges and histograms for the ingest and retrieval pipeline, exportable as JSON
+    or in the Prometheus text format.
+    """
+    _metrics: dict[str, dict[Labels, object]] = field(default_factory=dict, repr=False)
+    _kinds: dict[str, type] = field(default_factory=dict, repr=False)
+    _help: dict[str, str] = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def _get(self, kind: type, name: str, help_text: str, labels: dict):
+        with self._lock:
+            registered = self._kinds.setdefault(name, kind)
+            if registered is not kind:
+                raise ValueError(f"Metric {name} is already registered as a {registered.__name__}.")
+            if help_text:
+                self._help.setdefault(name, help_text)
+            series = self._metrics.setdefault(name, {})
+            key = _labels(labels)
+            if key not in series:
+                series[key] = kind()
+            return series[key]
+
+    def describe(self, name: str, help_text: str):
+        """Sets the HELP text exported for a metric."""
+        with self._lock:
+            self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, help_text: str = "", **labels):
+        counter = self._get(Counter, name, help_text, labels)
+        with self._lock:
+            counter.inc(amount)
+
+    def set(self, name: str, value: float, help_text: str = "", **labels):
+        gauge = self._get(Gauge, name, help_text, labels)
+        with self._lock:
+            gauge.set(value)
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels):
+        histogram = self._get(Histogram, name, help_text, labels)
+        with self._lock:
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, help_text: str = "", **labels) -> Iterator[None]:
+        """Observes the duration of the block, in seconds, in the `name` histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, help_text, **labels)
+
+    def value(self, name: str, **labels) -> float:
+        """Returns a counter or gauge value, or a histogram's observation count."""
+        metric = self._metrics.get(name, {}).get(_labels(labels))
+        if metric is None:
+            return 0
+        return metric.count if isinstance(metric, Histogram) else metric.value
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+            self._kinds.clear()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            exported = {}
+            for name, series in sorted(self._metrics.items()):
+                entries = []
+                for labels, metric in series.items():
+                    entry = {"labels": dict(labels)}
+                    if isinstance(metric, Histogram):
+                        entry.update(count=metric.count, sum=metric.sum,
+                                     mean=metric.sum / metric.count if metric.count else 0.0,
+                                     buckets=dict(zip(map(str, metric.buckets), metric.cumulative_counts())))
+                    else:
+                        entry["value"] = metric.value
+                    entries.append(entry)
+                exported[name] = {"type": self._kinds[name].__name__.lower(), "series": entries}
+            return exported
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._metrics.items()):
+                kind = self._kinds[name].__name__.lower()
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, metric in series.items():
+                    if isinstance(metric, Histogram):
+                        for bound, count in zip(metric.buckets, metric.cumulative_counts()):
+                            lines.append(f"{name}_bucket{_format_labels(labels, ('le', repr(float(bound))))} {count}")
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {metric.count}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {metric.sum}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+                    else:
+                        lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Writes the metrics to `path`, in the Prometheus text format for `.prom` files and as JSON otherwise."""
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+
+metrics = MetricsRegistry()
+metrics.describe("stage_seconds", "Duration of each pipeline stage.")
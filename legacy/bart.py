@@ -1,12 +1,13 @@
-from transformers import pipeline
+from internal.llm.model_registry import model_registry
 from internal.langchain.wikipedia_api import WikipediaDocumentLoader
 from langchain.text_splitter import TokenTextSplitter
 from neo4j import GraphDatabase
 from typing import List
 import re
 
-# Load BART model
-generator = pipeline("summarization", model="facebook/bart-large-cnn")
+# BART model, loaded on first call through the shared model registry
+def generator(*args, **kwargs):
+    return model_registry.get("summarization", "facebook/bart-large-cnn")(*args, **kwargs)
 
 # Neo4j configuration
 neo4j_uri = "bolt://localhost:7687"
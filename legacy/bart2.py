@@ -1,11 +1,12 @@
 import re
-from transformers import pipeline
+from internal.llm.model_registry import model_registry
 from internal.langchain.wikipedia_api import WikipediaDocumentLoader
 from langchain.text_splitter import TokenTextSplitter
 from neo4j import GraphDatabase
 
-# Initialize BART model pipeline for text summarization
-bart_pipeline = pipeline("summarization", model="facebook/bart-large-cnn")
+# BART model pipeline for text summarization, loaded on first call through the shared model registry
+def bart_pipeline(*args, **kwargs):
+    return model_registry.get("summarization", "facebook/bart-large-cnn")(*args, **kwargs)
 
 # Neo4j configuration
 neo4j_uri = "bolt://localhost:7687"
@@ -1,34 +1,81 @@
+import argparse
+import os
+
+from db.memory.memory_graph import InMemoryGraphEngine
 from db.neo4j.neo4j_connector import Neo4jEngine
-from internal.langchain.wikipedia_api import WikipediaDocumentLoader
+from internal.langchain.bulk_wikipedia_loader import BulkWikipediaLoader, add_page_arguments, loader_from_arguments
+from internal.langchain.chunk_manifest import ChunkManifest
+from internal.langchain.streaming_pipeline import StreamingPipeline
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from internal.llm.canonicalizer import EntityCanonicalizer
 from internal.llm.openai import ChatGptLLM
+from internal.metrics.metrics import metrics
 
 
-def main():
-    page_title = "Marcus Aurelius"
+def main(wikipedia_loader: BulkWikipediaLoader, stream: bool = False):
     neo4j_uri = "bolt://localhost:7687"
     neo4j_user = "neo4j"
     neo4j_password = "your_password"
-    neo4j_engine = Neo4jEngine(neo4j_uri, neo4j_user, neo4j_password)
+    # GRAPH_BACKEND=memory runs the whole pipeline against the in-process graph store, without Neo4j
+    if os.getenv("GRAPH_BACKEND") == "memory":
+        neo4j_engine = InMemoryGraphEngine()
+    else:
+        neo4j_engine = Neo4jEngine(neo4j_uri, neo4j_user, neo4j_password)
+
+    # Only chunks that are new or changed since the last run go to the LLM and to Neo4j.
+    # The in-memory graph starts empty on every run, so it always gets every chunk.
+    manifest = None if isinstance(neo4j_engine, InMemoryGraphEngine) else ChunkManifest()
+
+    if stream:
+        # Load, split, extract and store concurrently, writing relationships as soon as they are extracted
+        stored = StreamingPipeline(wikipedia_loader, ChatGptLLM([]), neo4j_engine, manifest=manifest).run()
+        print(f"Successfully stored {stored} relationships in Neo4j!")
+        return
 
-    # Step 1: Load and chunk Wikipedia page0
-    wikipedia_loader = WikipediaDocumentLoader(page_title)
-    chunks = wikipedia_loader.split_document(wikipedia_loader.load())
+    # Step 1: Load and chunk Wikipedia pages
+    with metrics.timer("stage_seconds", stage="fetch"):
+        documents = wikipedia_loader.load()
+    with metrics.timer("stage_seconds", stage="split"):
+        chunks = wikipedia_loader.split_document(documents)
+
+    if manifest is not None:
+        chunks = manifest.filter_new(chunks)
+    if not chunks:
+        print("No new or changed chunks, nothing to ingest.")
+        return
 
     # Step 2: Extract entities and relationships using OpenAI
     open_ai_llm = ChatGptLLM(chunks)
-    relationships = open_ai_llm.generate_relationships_csv()
+    with metrics.timer("stage_seconds", stage="extract"):
+        relationships = open_ai_llm.generate_relationships_csv_concurrent()
+
+    # Step 3: Merge name variants (e.g. "Emperor Marcus Aurelius") so each entity becomes a single node
+    with metrics.timer("stage_seconds", stage="canonicalize"):
+        relationships = EntityCanonicalizer().canonicalize_rows(relationships)
 
-    # Step 3: Store entities and relationships in Neo4j
-    neo4j_engine.store_in_neo4j_csv(relationships)
-    neo4j_engine.store_named_relationships_from_file("relationships.csv")
+    # Step 4: Store entities and relationships in Neo4j
+    with metrics.timer("stage_seconds", stage="write"):
+        neo4j_engine.store_relationships_batched(relationships)
+    if manifest is not None:
+        manifest.mark_processed(
+            chunk for chunk, result in zip(chunks, open_ai_llm.extraction_results) if result.ok)
     print(f"Successfully stored {len(relationships)} relationships in Neo4j!")
 
 
 if __name__ == "__main__":
-    main()
-    main()
+    parser = argparse.ArgumentParser(description="Build a knowledge graph from Wikipedia pages using OpenAI.")
+    add_page_arguments(parser)
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream chunks through extraction into Neo4j instead of processing stage by stage.")
+    parser.add_argument("--metrics-out", default=None,
+                        help="Write pipeline metrics to this file, in Prometheus format if it ends in .prom.")
+    args = parser.parse_args()
+    try:
+        main(loader_from_arguments(args), args.stream)
+    finally:
+        if args.metrics_out:
+            metrics.export(args.metrics_out)
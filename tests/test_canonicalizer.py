@@ -0,0 +1,54 @@
+import random
+import time
+
+from internal.llm.canonicalizer import EntityCanonicalizer, IncrementalCanonicalizer
+
+FIRST_NAMES = ["Marcus", "Gaius", "Lucius", "Publius", "Quintus", "Titus", "Gnaeus", "Aulus"]
+FAMILY_NAMES = ["Aurelius", "Julius", "Cornelius", "Valerius", "Claudius", "Flavius", "Antonius", "Junius"]
+
+
+def synthetic_names(count: int, seed: int = 3) -> list[str]:
+    """Distinct names that share most of their tokens, the worst case for shingle buckets."""
+    generator = random.Random(seed)
+    return [f"{generator.choice(FIRST_NAMES)} {generator.choice(FAMILY_NAMES)} {number}" for number in range(count)]
+
+
+def test_variants_merge():
+    mapping = EntityCanonicalizer().fit(
+        ["Marcus Aurelius", "Marcus Aurelius", "Emperor Marcus Aurelius", "Marcus Aurelious", "Marcus"])
+    assert set(mapping.values()) == {"Marcus Aurelius"}
+
+
+def test_numbered_and_distinct_names_stay_apart():
+    mapping = EntityCanonicalizer().fit(["Ptolemy II", "Ptolemy III", "Gaius Julius", "Gaius Junius"])
+    assert all(name == canonical for name, canonical in mapping.items())
+
+
+def test_synthetic_names_scale_without_merging():
+    names = synthetic_names(4000)
+    start = time.perf_counter()
+    mapping = EntityCanonicalizer().fit(names)
+    elapsed = time.perf_counter() - start
+
+    assert all(name == canonical for name, canonical in mapping.items())
+    # Every candidate pair is compared, so a quadratic bucket scan takes tens of seconds here
+    assert elapsed < 5.0
+
+
+def test_incremental_names_stay_stable():
+    canonicalizer = IncrementalCanonicalizer()
+    assert canonicalizer.canonicalize_rows([["Marcus Aurelius", "wrote", "Meditations"]]) == [
+        ["Marcus Aurelius", "wrote", "Meditations"]]
+    assert canonicalizer.canonicalize_rows([["Emperor Marcus Aurelius", "ruled", "Rome"],
+                                            ["Marcus", "knew", "Fronto"]]) == [
+        ["Marcus Aurelius", "ruled", "Rome"], ["Marcus Aurelius", "knew", "Fronto"]]
+
+
+def test_incremental_chunks_do_not_rehash_known_names():
+    canonicalizer = IncrementalCanonicalizer()
+    names = synthetic_names(4000)
+    start = time.perf_counter()
+    for chunk_start in range(0, len(names), 20):
+        canonicalizer.canonicalize_rows([[name, "knew", "Rome"] for name in names[chunk_start:chunk_start + 20]])
+    assert time.perf_counter() - start < 5.0
+    assert len(canonicalizer) == len(names) + 1